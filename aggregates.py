@@ -0,0 +1,128 @@
+"""Rolling-window aggregates and leaderboards, kept in summary tables for the data page
+
+    python aggregates.py [--leagues ...]                          rebuild as of each league's latest gameweek
+    python aggregates.py --show 'La Liga' MID 5 xg [--top 20]     print a leaderboard
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from db import bulk_insert, mysqlconnect, to_table
+from leagues import URLS
+from migrations import GAME_COLS, quote, stat_cols
+from scoring import GROUPS, group_codes
+
+# gameweek windows kept per player, and how many places each leaderboard keeps
+WINDOWS = [3, 5, 10]
+TOP_N = 20
+
+# stats with leaderboards, as named in player_game
+LEADERBOARD_STATS = ['gls', 'ast', 'xg', 'npxg', 'xag', 'sh', 'sot', 'sca', 'gca', 'kp', 'prgp', 'prgc',
+                     'tkl', 'interceptions', 'saves', 'Min']
+
+# the leaderboard across every position
+ALL = 'All'
+
+
+def window_frame(games, last_gw, windows=WINDOWS):
+    """Per-player sums and averages over each window of gameweeks ending at last_gw
+
+    games is player_game rows covering at least the longest window. Each
+    player gets one row per window they played in, with their latest
+    League, Pos and Club.
+    """
+    sum_cols, avg_cols = stat_cols([col for col in games.columns if col in GAME_COLS])
+    games = games.assign(**{col: pd.to_numeric(games[col], errors='coerce') for col in sum_cols + avg_cols})
+    games = games.sort_values('gw')
+
+    frames = []
+    for window in windows:
+        grouped = games[games['gw'] > last_gw - window].groupby('playerID', sort=False)
+        frame = grouped[['League', 'Pos', 'Club']].last()
+        frame = frame.join(grouped[sum_cols].sum()).join(grouped[avg_cols].mean())
+        frames.append(frame.assign(window_gws=window, last_gw=last_gw, games=grouped.size()))
+    return pd.concat(frames).reset_index()
+
+
+def leaderboards(windows, stats=LEADERBOARD_STATS, top=TOP_N):
+    """The top players per League, position group (and All), window and stat, ranked from 1 by place"""
+    stats = [col for col in windows.columns if col.lower() in {stat.lower() for stat in stats}]
+    ranked = windows.assign(Pos=np.asarray(GROUPS)[group_codes(windows)])
+    ranked = ranked.melt(id_vars=['playerID', 'League', 'Pos', 'window_gws', 'last_gw'], value_vars=stats,
+                         var_name='stat', value_name='value')
+    ranked = pd.concat([ranked, ranked.assign(Pos=ALL)], ignore_index=True)
+
+    # nobody makes a leaderboard for a stat they have none of; ties go to the lower id so reruns agree
+    ranked = ranked[ranked['value'] > 0]
+    keys = ['League', 'Pos', 'window_gws', 'stat']
+    ranked = ranked.sort_values(keys + ['value', 'playerID'], ascending=[True] * len(keys) + [False, True])
+    ranked = ranked.groupby(keys, sort=False).head(top)
+    return ranked.assign(stat=ranked['stat'].str.lower(), place=ranked.groupby(keys, sort=False).cumcount() + 1)
+
+
+def refresh(conn, league, windows=WINDOWS, top=TOP_N):
+    """Rebuild a league's player_window and leaderboard rows as of its latest loaded gameweek
+
+    Only the gameweeks inside the longest window are read, so a refresh
+    costs the same in gameweek 3 as in gameweek 38. Rows are upserted
+    before the stale ones are pruned, so readers never see an empty board.
+    Returns the gameweek the aggregates are as of.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT MAX(gw) FROM player_game WHERE League = %s', (league,))
+        last_gw = cursor.fetchone()[0]
+        if last_gw is None:
+            return None
+        # positions come from player, as in player_stats; player_game rows are loaded without one
+        cols = ', '.join('p.Pos' if col == 'Pos' else f'g.{quote(col)}' for col in GAME_COLS)
+        cursor.execute(f"""
+            SELECT {cols} FROM player_game g
+            JOIN player p ON p.playerID = g.playerID
+            WHERE g.League = %s AND g.gw > %s
+        """, (league, last_gw - max(windows)))
+        games = pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+
+    player_windows = window_frame(games, last_gw, windows)
+    boards = leaderboards(player_windows, top=top)
+    bulk_insert(conn, 'player_window', to_table(player_windows, 'player_window'), ['playerID', 'window_gws'])
+    bulk_insert(conn, 'leaderboard', to_table(boards, 'leaderboard'), ['League', 'Pos', 'window_gws', 'stat', 'place'])
+
+    # players who dropped out of every window, and places a shorter board no longer fills
+    with conn.cursor() as cursor:
+        cursor.execute('DELETE FROM player_window WHERE League = %s AND last_gw < %s', (league, last_gw))
+        cursor.execute('DELETE FROM leaderboard WHERE League = %s AND last_gw < %s', (league, last_gw))
+    conn.commit()
+    print(f'Refreshed {league} aggregates as of GW {last_gw}: {len(player_windows)} player windows, {len(boards)} places')
+    return last_gw
+
+
+def leaderboard(conn, league, pos=ALL, window=WINDOWS[1], stat='gls', top=TOP_N):
+    """One leaderboard, best first, read by primary key prefix however long the season is"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT l.place, l.playerID, p.Player, p.Club, l.value, l.last_gw
+            FROM leaderboard l
+            JOIN player p ON p.playerID = l.playerID
+            WHERE l.League = %s AND l.Pos = %s AND l.window_gws = %s AND l.stat = %s
+            ORDER BY l.place
+            LIMIT %s
+        """, (league, pos, window, stat.lower(), top))
+        return pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--show', nargs=4, metavar=('LEAGUE', 'POS', 'WINDOW', 'STAT'))
+    parser.add_argument('--top', type=int, default=TOP_N)
+    args = parser.parse_args()
+
+    conn = mysqlconnect()
+    if args.show:
+        league, pos, window, stat = args.show
+        print(leaderboard(conn, league, pos, int(window), stat, args.top).to_string(index=False))
+    else:
+        for league in args.leagues:
+            refresh(conn, league)
+    conn.close()
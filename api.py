@@ -0,0 +1,339 @@
+"""Read-only JSON API over the fantasy database and Firestore, for the front end in index/
+
+    python api.py [--host 127.0.0.1] [--port 8080] [--ttl 30] [--cache-size 1024] [--pool-size 10]
+
+    GET /players?league=&club=&pos=&limit=&offset=
+    GET /players/search?q=&league=&club=&pos=&limit=
+    GET /players/{id}
+    GET /players/{id}/games
+    GET /stats?league=&pos=&order=gls&limit=&offset=
+    GET /leaderboards/{league}/{pos}/{window}/{stat}?limit=
+    GET /firestore/leagues/{league}/clubs
+    GET /firestore/leagues/{league}/clubs/{club}/players
+    GET /firestore/leagues/{league}/clubs/{club}/players/{id}/games
+    GET /health
+
+Responses are cached in process for --ttl seconds, least recently used
+first out, and dropped as soon as an ingestion run commits (the manifest's
+generation goes up). Every response has an ETag, so clients revalidating
+with If-None-Match get an empty 304 back.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import aiomysql
+import pandas as pd
+from aiohttp import web
+
+from aggregates import TOP_N, WINDOWS
+from db import read_config
+from manifest import MANIFEST_PATH, Manifest
+from migrations import TABLES
+from search import COLUMNS, SearchIndex
+
+CACHE_TTL = 30
+CACHE_SIZE = 1024
+POOL_SIZE = 10
+
+# how often the manifest is checked for newly committed gameweeks
+POLL_SECONDS = 2
+
+# rows per page unless limit says otherwise, and the most a page can have
+PAGE_SIZE = 50
+MAX_LIMIT = 500
+
+
+class TTLCache:
+    """Least-recently-used responses that also expire ttl seconds after they were cached
+
+    generation is the manifest generation the entries were read at, and
+    inflight the queries running for urls that missed.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[2] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key, body, etag):
+        self.entries[key] = (body, etag, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+CACHE = web.AppKey('cache', TTLCache)
+CONFIG = web.AppKey('config', dict)
+MANIFEST = web.AppKey('manifest', str)
+POOL = web.AppKey('pool', aiomysql.Pool)
+SEARCH = web.AppKey('search', SearchIndex)
+WATCHER = web.AppKey('watcher', asyncio.Task)
+
+
+def to_json(value):
+    # DECIMAL columns come back as Decimal, timestamps as datetimes
+    return float(value) if isinstance(value, Decimal) else str(value)
+
+
+def cached(query):
+    """Turn a coroutine returning json-able data into a handler with caching and conditional responses
+
+    Concurrent misses for the same url share one query, and a result is
+    only cached if no ingestion committed while it ran.
+    """
+    async def handler(request):
+        cache = request.app[CACHE]
+        key = request.path + '?' + '&'.join(f'{k}={v}' for k, v in sorted(request.query.items()))
+        entry = cache.get(key)
+        if entry is None:
+            if key not in cache.inflight:
+                cache.inflight[key] = asyncio.ensure_future(respond(request, query, key))
+            try:
+                entry = await asyncio.shield(cache.inflight[key])
+            finally:
+                cache.inflight.pop(key, None)
+
+        body, etag = entry[:2]
+        headers = {'ETag': etag, 'Cache-Control': f'max-age={cache.ttl:g}'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type='application/json', headers=headers)
+
+    return handler
+
+
+async def respond(request, query, key):
+    cache = request.app[CACHE]
+    generation = cache.generation
+    body = json.dumps(await query(request), default=to_json, separators=(',', ':')).encode()
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    if cache.generation == generation:
+        cache.set(key, body, etag)
+    return body, etag
+
+
+async def fetch_all(request, sql, args=()):
+    async with request.app[POOL].acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, args)
+            return await cursor.fetchall()
+
+
+def page(request):
+    """limit and offset from the query string, within bounds"""
+    try:
+        limit = min(int(request.query.get('limit', PAGE_SIZE)), MAX_LIMIT)
+        offset = max(int(request.query.get('offset', 0)), 0)
+    except ValueError:
+        raise web.HTTPBadRequest(text='limit and offset must be integers')
+    return max(limit, 0), offset
+
+
+def filters(request, alias=''):
+    """WHERE clause and args for the league, club and pos query parameters"""
+    clauses, args = [], []
+    for param, col in [('league', 'League'), ('club', 'Club'), ('pos', 'Pos')]:
+        if param in request.query:
+            clauses.append(f'{alias}{col} = %s')
+            args.append(request.query[param])
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), args
+
+
+@cached
+async def players(request):
+    where, args = filters(request)
+    limit, offset = page(request)
+    return await fetch_all(request, f'SELECT * FROM player{where} ORDER BY playerID LIMIT %s OFFSET %s',
+                           args + [limit, offset])
+
+
+@cached
+async def player(request):
+    player_id = request.match_info['id']
+    rows = await fetch_all(request, 'SELECT * FROM player WHERE playerID = %s', (player_id,))
+    if not rows:
+        raise web.HTTPNotFound(text=f'no player {player_id}')
+    stats = await fetch_all(request, 'SELECT * FROM player_stats WHERE playerID = %s', (player_id,))
+    return {**rows[0], 'stats': stats[0] if stats else None}
+
+
+@cached
+async def player_games(request):
+    return await fetch_all(request, 'SELECT * FROM player_game WHERE playerID = %s ORDER BY gw', (request.match_info['id'],))
+
+
+async def search(request):
+    # the index answers in well under a millisecond and is kept current, so it isn't cached
+    limit, _ = page(request)
+    query = request.query
+    results = request.app[SEARCH].search(query.get('q', ''), query.get('league'), query.get('club'), query.get('pos'), limit)
+    return web.json_response([{**player._asdict(), 'score': score} for player, score in results])
+
+
+async def refresh_search(app):
+    async with app[POOL].acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM player')
+            frame = pd.DataFrame(await cursor.fetchall(), columns=COLUMNS)
+    await asyncio.to_thread(app[SEARCH].update, frame, True)
+
+
+# player_stats columns stats can be ordered by, keyed by lowercase name
+STATS_ORDER = {col.lower(): col for col, _ in TABLES['player_stats']['columns']}
+
+
+@cached
+async def stats(request):
+    order = STATS_ORDER.get(request.query.get('order', 'gls').lower())
+    if order is None:
+        raise web.HTTPBadRequest(text=f'can only order by {", ".join(STATS_ORDER)}')
+    where, args = filters(request, alias='s.')
+    limit, offset = page(request)
+    return await fetch_all(request, f"""
+        SELECT p.Player, s.* FROM player_stats s
+        JOIN player p ON p.playerID = s.playerID{where}
+        ORDER BY s.`{order}` DESC, s.playerID LIMIT %s OFFSET %s
+    """, args + [limit, offset])
+
+
+@cached
+async def leaderboard(request):
+    info = request.match_info
+    if not info['window'].isdigit() or int(info['window']) not in WINDOWS:
+        raise web.HTTPBadRequest(text=f'window must be one of {WINDOWS}')
+    limit = min(page(request)[0], TOP_N)
+    return await fetch_all(request, """
+        SELECT l.place, l.playerID, p.Player, p.Club, l.value, l.last_gw
+        FROM leaderboard l
+        JOIN player p ON p.playerID = l.playerID
+        WHERE l.League = %s AND l.Pos = %s AND l.window_gws = %s AND l.stat = %s
+        ORDER BY l.place
+        LIMIT %s
+    """, (info['league'], info['pos'], int(info['window']), info['stat'].lower(), limit))
+
+
+def documents(collection):
+    return [{'id': doc.id, **(doc.to_dict() or {})} for doc in collection.stream()]
+
+
+async def firestore_query(request, path):
+    # importing firestore connects to it, so the sql-only deployment never does
+    import firestore
+
+    def run():
+        ref = firestore.db
+        for i, part in enumerate(path):
+            ref = ref.collection(part) if i % 2 == 0 else ref.document(part)
+        return documents(ref)
+
+    return await asyncio.to_thread(run)
+
+
+@cached
+async def firestore_clubs(request):
+    return await firestore_query(request, ['leagues', request.match_info['league'], 'clubs'])
+
+
+@cached
+async def firestore_players(request):
+    info = request.match_info
+    return await firestore_query(request, ['leagues', info['league'], 'clubs', info['club'], 'players'])
+
+
+@cached
+async def firestore_games(request):
+    info = request.match_info
+    return await firestore_query(request, ['leagues', info['league'], 'clubs', info['club'], 'players', info['id'], 'games'])
+
+
+async def health(request):
+    cache, pool = request.app[CACHE], request.app[POOL]
+    return web.json_response({'generation': cache.generation, 'cached': len(cache.entries),
+                              'hits': cache.hits, 'misses': cache.misses,
+                              'pool': {'size': pool.size, 'free': pool.freesize}})
+
+
+async def watch_generation(app):
+    """Drop every cached response and update the search index once an ingestion run commits something"""
+    cache = app[CACHE]
+    manifest = Manifest(app[MANIFEST])
+    try:
+        while True:
+            generation = await asyncio.to_thread(manifest.generation)
+            if generation != cache.generation:
+                cache.generation = generation
+                cache.clear()
+                try:
+                    await refresh_search(app)
+                except Exception as e:
+                    print(f'Search index not updated: {type(e).__name__}: {e}')
+            await asyncio.sleep(POLL_SECONDS)
+    finally:
+        manifest.close()
+
+
+async def start(app):
+    # autocommit so pooled connections see each load as soon as it commits, not a stale snapshot
+    app[POOL] = await aiomysql.create_pool(autocommit=True, charset='utf8mb4', **app[CONFIG])
+    app[WATCHER] = asyncio.ensure_future(watch_generation(app))
+
+
+async def stop(app):
+    app[WATCHER].cancel()
+    app[POOL].close()
+    await app[POOL].wait_closed()
+
+
+def make_app(config=None, pool_size=POOL_SIZE, ttl=CACHE_TTL, cache_size=CACHE_SIZE, manifest_path=MANIFEST_PATH):
+    app = web.Application()
+    app[CONFIG] = {'minsize': 1, 'maxsize': pool_size, **(config or read_config())}
+    app[CACHE] = TTLCache(cache_size, ttl)
+    app[MANIFEST] = manifest_path
+    app[SEARCH] = SearchIndex()
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+    app.router.add_get('/players', players)
+    app.router.add_get('/players/search', search)
+    app.router.add_get('/players/{id}', player)
+    app.router.add_get('/players/{id}/games', player_games)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/leaderboards/{league}/{pos}/{window}/{stat}', leaderboard)
+    app.router.add_get('/firestore/leagues/{league}/clubs', firestore_clubs)
+    app.router.add_get('/firestore/leagues/{league}/clubs/{club}/players', firestore_players)
+    app.router.add_get('/firestore/leagues/{league}/clubs/{club}/players/{id}/games', firestore_games)
+    app.router.add_get('/health', health)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ttl', type=float, default=CACHE_TTL)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE)
+    args = parser.parse_args()
+    web.run_app(make_app(pool_size=args.pool_size, ttl=args.ttl, cache_size=args.cache_size),
+                host=args.host, port=args.port)
@@ -0,0 +1,1005 @@
+"""Offline benchmarks for the scraping pipeline, run against saved fbref pages
+
+    python benchmarks.py record <match url> [<match url> ...]
+    python benchmarks.py parse [--fixtures data/fixtures/matches]
+    python benchmarks.py check [--fixtures data/fixtures/matches]     (exits non-zero if assembly output changed)
+    python benchmarks.py pipeline [--fixtures data/fixtures/matches] [--matches 40] [--latency 0.05] [--workers 1 4 8]
+    python benchmarks.py assemble [--fixtures data/fixtures/matches] [--matches 10]
+    python benchmarks.py clean [--csv data/match_data/gw1.csv]
+    python benchmarks.py bulk [--csv data/match_data/gw1.csv] [--gws 38]   (needs sql.config)
+    python benchmarks.py stats [--csv data/match_data/gw1.csv] [--gws 38]  (needs sql.config)
+    python benchmarks.py writers [--csv data/match_data/gw1.csv] [--leagues 4] [--gws 10] [--writers 1 2 4]  (needs sql.config)
+    python benchmarks.py scoring [--csv data/match_data/gw1.csv] [--gws 38] [--leagues 5]
+    python benchmarks.py search [--csv data/match_data/gw1.csv] [--players 2500]
+    python benchmarks.py corpus [--leagues 'Premier League' ...] [--gws 1] [--profiles 20]
+    python benchmarks.py corpus --fixtures [--copies 10]     (built from data/fixtures/matches, no network)
+    python benchmarks.py suite [--repeat 3] [--mysql] [--json] [--out results.json] [--save-baseline]
+    python benchmarks.py api [--url http://127.0.0.1:8080] [--paths /players /stats] [--concurrency 50]
+                             [--requests 5000] [--conditional]                 (start api.py first)
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup as bs
+from lxml import html as lxml_html
+
+import fetch
+import match_report
+import scraping
+from fetch import fetch_many
+from leagues import URLS
+from match_report import assemble, parse_match_report
+from scraping import HOME_URL, clean_columns, match_id
+
+FIXTURES_DIR = 'data/fixtures'
+CORPUS_DIR = os.path.join(FIXTURES_DIR, 'corpus')
+BASELINE_PATH = os.path.join(FIXTURES_DIR, 'baseline.json')
+
+# a stage regresses once it's this much slower, or uses this much more memory, than the baseline
+TOLERANCE = 0.25
+
+# latencies within this many ms of the baseline are timer and scheduler noise however large the ratio
+MIN_DELTA_MS = 5
+
+
+def load_fixtures(path):
+    fixtures = []
+    for file in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(file, encoding='utf-8') as f:
+            fixtures.append(f.read())
+    return fixtures
+
+
+def record(urls, path=os.path.join(FIXTURES_DIR, 'matches')):
+    """Save match report pages so benchmarks can run without the network"""
+    os.makedirs(path, exist_ok=True)
+    for url, html in zip(urls, fetch_many(urls)):
+        with open(os.path.join(path, f'{match_id(url)}.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f'Saved {url}')
+
+
+def legacy_clean_columns(df):
+    """clean_columns before vectorizing: per-cell lambdas over (text, link) tuples"""
+    df = df.loc[:, ~df.columns.duplicated()]
+    df = df.replace(r'^\s*$', np.nan, regex=True)
+    df = df.dropna(subset=['Player'])
+    if df['Player'].str.contains('Players').any():
+        df = df[:-1]
+    df = df[df['Player'].map(lambda x: x[1] is not None)]
+    df['player_url'] = df['Player'].map(lambda x: HOME_URL[:-1] + x[1])
+    if isinstance(df['Player'].iloc[0], tuple):
+        df['playerID'] = df['Player'].map(lambda x: x[1].split('/')[-2])
+        df['Player'] = df['Player'].map(lambda x: x[0])
+    cols = df.columns.tolist()
+    cols = cols[-1:] + cols[:-1]
+    df = df[cols]
+    df = df.applymap(lambda x: x[0] if isinstance(x, tuple) else x)
+    if 'Nation' in df.columns:
+        df = df.dropna(subset=['Nation'])
+        df['Nation'] = df['Nation'].map(lambda x: x.split(' ')[-1])
+    if 'Age' in df.columns:
+        df = df.dropna(subset=['Age'])
+        df['Age'] = df['Age'].map(lambda x: x.split('-')[0])
+    df = df.replace(r'^\s*$', np.nan, regex=True)
+    df = df.fillna(0)
+    return df.apply(pd.to_numeric, errors='ignore')
+
+
+def legacy_parse(html):
+    """The pre-lxml match parse: pd.read_html plus BeautifulSoup for the team names"""
+    df = pd.read_html(StringIO(html), extract_links='all')[3:]
+    match_df = pd.DataFrame(columns=['Player', 'playerID', 'Club']).astype({'playerID': str})
+    soup = bs(html, 'html.parser')
+    df_lst = [x for x in df if 'Event' not in [col[-1][0] for col in x.columns]]
+    teams = [x.find('a').text for x in soup.find_all('strong') if x.find(
+        'a') and '/en/squads/' in x.find('a')['href']]
+    team_a = df_lst[:len(df_lst)//2]
+    team_b = df_lst[len(df_lst)//2:]
+    for x in team_a:
+        x['Club'] = teams[0]
+    for x in team_b:
+        x['Club'] = teams[1]
+    for df in team_a + team_b:
+        df.columns = [col[-1][0] if col != 'Club' else col for col in df.columns]
+        df = df.applymap(lambda val: val if val[1] else val[0])
+        df = legacy_clean_columns(df)
+        df['playerID'] = df['playerID'].astype(str)
+        match_df = pd.merge(match_df, df, how='outer')
+    return match_df.groupby(['Player', 'playerID', 'Club']).first().reset_index()
+
+
+def lxml_parse(html):
+    report = parse_match_report(html, url='https://fbref.com/en/matches/00000000/fixture')
+    match_df = pd.DataFrame(columns=['Player', 'playerID', 'Club']).astype({'playerID': str})
+    for df in report.frames():
+        match_df = pd.merge(match_df, df, how='outer')
+    return match_df.groupby(['Player', 'playerID', 'Club']).first().reset_index()
+
+
+def legacy_assemble(reports):
+    """The pre-columnar gameweek assembly: outer merge per table, concat per match"""
+    gw_df = pd.DataFrame(columns=['Player', 'playerID'])
+    for report in reports:
+        match_df = pd.DataFrame(columns=['Player', 'playerID', 'Club']).astype({'playerID': str})
+        for df in report.frames():
+            match_df = pd.merge(match_df, df, how='outer')
+        match_df = match_df.groupby(['Player', 'playerID', 'Club']).first().reset_index()
+        match_df = match_df.drop(columns='Pos')
+        match_df['matchID'] = report.match_id
+        gw_df = pd.concat([gw_df, match_df], ignore_index=True)
+    return gw_df.apply(pd.to_numeric, errors='ignore')
+
+
+def columnar_assemble(reports):
+    return assemble(reports).drop(columns='Pos').apply(pd.to_numeric, errors='ignore')
+
+
+def legacy_gameweek(pages):
+    """The original gameweek path end to end: read_html + bs4 per (match id, html) page, merged, concatenated"""
+    gw_df = pd.DataFrame(columns=['Player', 'playerID'])
+    for match, html in pages:
+        match_df = legacy_parse(html).drop(columns='Pos')
+        match_df['matchID'] = match
+        gw_df = pd.concat([gw_df, match_df], ignore_index=True)
+    return gw_df
+
+
+def normalized(df):
+    # the old path filled blanks with 0 and typed each table on its own, so compare values rather than dtypes
+    return df.fillna(0).apply(pd.to_numeric, errors='ignore').reset_index(drop=True)
+
+
+def check_assemble(path):
+    """Fail unless lxml parsing + columnar assembly gives the frame the original read_html path did"""
+    fixtures = load_fixtures(path)
+    if not fixtures:
+        raise SystemExit(f'No fixtures in {path}, save some with `python benchmarks.py record <url>`')
+
+    # every fixture twice under distinct match ids, so rows from different matches have to stay apart
+    pages = [(f'{i:08x}', fixtures[i % len(fixtures)]) for i in range(2 * len(fixtures))]
+    legacy = legacy_gameweek(pages)
+    columnar = assemble([parse_match_report(html, url=f'https://fbref.com/en/matches/{match}/fixture')
+                         for match, html in pages]).drop(columns='Pos')
+    pd.testing.assert_frame_equal(normalized(legacy), normalized(columnar), check_dtype=False)
+    print(f'{len(pages)} match reports: lxml + columnar assemble matches read_html + merge '
+          f'({len(columnar)} rows x {len(columnar.columns)} columns)')
+
+
+def profile(func, *args):
+    """Seconds for one call, then peak traced bytes for a second, traced call"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def timeit(func, fixtures, repeat=3):
+    """Best-of-repeat seconds per fixture"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in fixtures:
+            func(html)
+        best = min(best, time.perf_counter() - start)
+    return best / len(fixtures)
+
+
+def bench_parse(path):
+    fixtures = load_fixtures(path)
+    if not fixtures:
+        print(f'No fixtures in {path}, save some with `python benchmarks.py record <url>`')
+        return
+
+    # parsing alone, then parsing plus the per-match merge the scraper does
+    legacy = timeit(legacy_parse, fixtures)
+    parser = timeit(lambda html: parse_match_report(html, url='https://fbref.com/en/matches/00000000/x'), fixtures)
+    full = timeit(lxml_parse, fixtures)
+    assembled = timeit(lambda html: assemble([parse_match_report(html, url='https://fbref.com/en/matches/00000000/x')]),
+                       fixtures)
+    print(f'{len(fixtures)} match reports')
+    print(f'read_html + bs4 + clean_columns: {legacy * 1000:.1f} ms/match')
+    print(f'lxml parse_match_report:         {parser * 1000:.1f} ms/match ({legacy / parser:.1f}x)')
+    print(f'lxml parse + merge:              {full * 1000:.1f} ms/match ({legacy / full:.1f}x)')
+    print(f'lxml parse + assemble:           {assembled * 1000:.1f} ms/match ({legacy / assembled:.1f}x)')
+
+
+
+def bench_pipeline(path, matches=40, latency=0.05, workers=(1, 4, 8)):
+    """Fetch+parse wall time for a batch of reports, fetches simulated with a fixed latency"""
+    from pipeline import parse_match_reports
+
+    fixtures = load_fixtures(path)
+    if not fixtures:
+        print(f'No fixtures in {path}, save some with `python benchmarks.py record <url>`')
+        return
+    urls = [f'https://fbref.com/en/matches/{i:08x}/x' for i in range(matches)]
+    pages = dict(zip(urls, (fixtures[i % len(fixtures)] for i in range(matches))))
+
+    def fetch(url):
+        time.sleep(latency)
+        return pages[url]
+
+    print(f'{matches} match reports, {latency * 1000:.0f} ms per fetch')
+    baseline = None
+    for n in workers:
+        start = time.perf_counter()
+        parse_match_reports(urls, workers=n, fetch=fetch)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f'{n:>2} parse workers: {elapsed:.2f} s ({baseline / elapsed:.1f}x)')
+
+def bench_assemble(path, matches=10):
+    fixtures = load_fixtures(path)
+    if not fixtures:
+        print(f'No fixtures in {path}, save some with `python benchmarks.py record <url>`')
+        return
+
+    # a gameweek of reports, reusing fixtures under distinct match ids if needed
+    reports = [parse_match_report(fixtures[i % len(fixtures)], url=f'https://fbref.com/en/matches/{i:08x}/fixture')
+               for i in range(matches)]
+
+    check_assemble(path)
+    legacy, legacy_time, legacy_peak = profile(legacy_assemble, reports)
+    columnar, columnar_time, columnar_peak = profile(columnar_assemble, reports)
+    print(f'{matches} match gameweek ({len(columnar)} rows x {len(columnar.columns)} columns)')
+    print(f'merge + concat: {legacy_time * 1000:.1f} ms, peak {legacy_peak / 2 ** 20:.1f} MiB')
+    print(f'columnar:       {columnar_time * 1000:.1f} ms, peak {columnar_peak / 2 ** 20:.1f} MiB '
+          f'({legacy_time / columnar_time:.1f}x faster)')
+
+
+def tuple_frame(df):
+    """Rebuild the read_html(extract_links='all') frame a cleaned player table came from"""
+    raw = df.drop(columns=['gw', 'playerID']).astype(str)
+    raw['Nation'] = raw['Nation'].str.lower() + ' ' + raw['Nation']
+    raw['Age'] = raw['Age'].str.replace('.0', '', regex=False) + '-123'
+    links = pd.DataFrame(None, index=raw.index, columns=raw.columns, dtype=object)
+    links['Player'] = '/en/players/' + df['playerID'] + '/' + df['Player'].str.replace(' ', '-')
+    cells = np.empty(raw.shape, dtype=object)
+    for j, col in enumerate(raw.columns):
+        cells[:, j] = list(zip(raw[col], links[col]))
+    return pd.DataFrame(cells, columns=[(col, None) for col in raw.columns])
+
+
+def bench_clean(path, repeat=5):
+    frame = tuple_frame(pd.read_csv(path, dtype={'playerID': str}))
+
+    legacy = clean = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        legacy_clean_columns(frame.set_axis([col[0] for col in frame.columns], axis=1))
+        legacy = min(legacy, time.perf_counter() - start)
+        start = time.perf_counter()
+        clean_columns(frame)
+        clean = min(clean, time.perf_counter() - start)
+    print(f'{path}: {frame.shape[0]} rows x {frame.shape[1]} columns')
+    print(f'per-cell lambdas: {legacy * 1000:.1f} ms')
+    print(f'vectorized:       {clean * 1000:.1f} ms ({legacy / clean:.1f}x)')
+
+
+def season_frame(path, gws):
+    """gw1.csv repeated as a season of player_game rows"""
+    df = pd.read_csv(path, dtype={'playerID': str})
+    df = df.drop_duplicates(['playerID'])
+    return pd.concat([df.assign(gw=gw) for gw in range(1, gws + 1)], ignore_index=True)
+
+
+# sql types for the scratch table a frame is bulk loaded into
+SQL_TYPES = {'int64': 'INT DEFAULT 0', 'int32': 'INT DEFAULT 0', 'int16': 'SMALLINT DEFAULT 0',
+             'float64': 'FLOAT DEFAULT 0', 'float32': 'FLOAT DEFAULT 0', 'object': 'VARCHAR(255)',
+             'category': 'VARCHAR(255)'}
+
+
+def sql_cols(df):
+    """(column, sql type) for every column of a frame"""
+    return [(col, SQL_TYPES.get(str(dtype), str(dtype))) for col, dtype in df.dtypes.items()]
+
+
+def bench_bulk(path, gws=38):
+    import pymysql
+    from db import bulk_insert, mysqlconnect, quote
+
+    df = season_frame(path, gws)
+    conn = mysqlconnect(local_infile=True)
+    create = 'CREATE TABLE bench_player_game ({}, PRIMARY KEY (playerID, gw))'.format(
+        ', '.join(f'{quote(col)} {dtype}' for col, dtype in sql_cols(df)))
+
+    def fresh_table():
+        with conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS bench_player_game')
+            cursor.execute(create)
+        conn.commit()
+
+    def row_by_row():
+        cols = ', '.join(quote(col) for col in df.columns)
+        sql = f'INSERT INTO bench_player_game ({cols}) VALUES ({", ".join(["%s"] * len(df.columns))})'
+        with conn.cursor() as cursor:
+            for row in df.astype(object).itertuples(index=False):
+                try:
+                    cursor.execute(sql, tuple(row))
+                except pymysql.err.IntegrityError:
+                    continue
+        conn.commit()
+
+    results = {}
+    for name, load in [('row by row', row_by_row),
+                       ('executemany', lambda: bulk_insert(conn, 'bench_player_game', df, ['playerID', 'gw'], on_duplicate='skip')),
+                       ('load data infile', lambda: bulk_insert(conn, 'bench_player_game', df, ['playerID', 'gw'],
+                                                                on_duplicate='skip', local_infile=True))]:
+        fresh_table()
+        start = time.perf_counter()
+        load()
+        results[name] = time.perf_counter() - start
+
+    with conn.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS bench_player_game')
+    conn.close()
+    print(f'{len(df)} player_game rows ({gws} gameweeks)')
+    for name, elapsed in results.items():
+        print(f'{name:<17} {elapsed:.2f} s ({results["row by row"] / elapsed:.1f}x)')
+
+
+
+def bench_stats(path, gws=38, database='fantasy_bench'):
+    """Per-gameweek player_game load time with the per-row triggers vs one set-wise refresh
+
+    Runs in a scratch database since the triggers and refresh use the real table names.
+    """
+    from db import bulk_insert, migrate, mysqlconnect, refresh_player_stats, to_table
+
+    df = season_frame(path, gws)
+    players = df.drop_duplicates('playerID')[['playerID', 'Player', 'Pos', 'Club', 'Nation']].assign(League='Premier League')
+    players = to_table(players, 'player')
+    df = to_table(df.assign(League='Premier League', matchID=df['gw'].map('{:08d}'.format)), 'player_game')
+    conn = mysqlconnect()
+    with conn.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE IF NOT EXISTS {database}')
+        cursor.execute(f'USE {database}')
+
+    def fresh_tables():
+        with conn.cursor() as cursor:
+            for table in ['player_stats', 'player_game', 'player', 'schema_version']:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.commit()
+        migrate(conn)
+        bulk_insert(conn, 'player', players, ['playerID'])
+
+    def triggers(gw_df):
+        bulk_insert(conn, 'player_game', gw_df, ['playerID', 'gw'], on_duplicate='skip')
+
+    def set_wise(gw_df):
+        with conn.cursor() as cursor:
+            cursor.execute('SET @bulk_load = 1')
+        bulk_insert(conn, 'player_game', gw_df, ['playerID', 'gw'], on_duplicate='skip')
+        with conn.cursor() as cursor:
+            cursor.execute('SET @bulk_load = NULL')
+        refresh_player_stats(conn, gw_df['playerID'])
+
+    results = {}
+    for name, load in [('triggers', triggers), ('set-wise', set_wise)]:
+        fresh_tables()
+        times = []
+        for gw, gw_df in df.groupby('gw', sort=True):
+            start = time.perf_counter()
+            load(gw_df)
+            times.append(time.perf_counter() - start)
+        results[name] = times
+
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+    conn.close()
+
+    print(f'{df["playerID"].nunique()} players x {gws} gameweeks')
+    checkpoints = sorted({1, max(1, gws // 2), gws})
+    print(f'{"":<9} ' + ' '.join(f'{"GW " + str(gw):>9}' for gw in checkpoints) + f' {"total":>9}')
+    for name, times in results.items():
+        print(f'{name:<9} ' + ' '.join(f'{times[gw - 1]:>8.2f}s' for gw in checkpoints) + f' {sum(times):>8.2f}s')
+
+
+def bench_writers(path, leagues=4, gws=10, writers=(1, 2, 4), database='fantasy_bench'):
+    """Loading several leagues' gameweeks on one shared connection vs one pooled connection per league
+
+    Each league is gw1.csv under its own player ids, written match by match
+    the way ingest does, with its leagues side by side. Runs in a scratch
+    database since the loads use the real table names.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from db import ConnectionPool, load_players, migrate, mysqlconnect, read_config
+    from sinks import MySQLSink
+
+    season = season_frame(path, gws)
+    frames = {f'League {i}': season.assign(playerID=str(i) + season['playerID'].str[1:], League=f'League {i}',
+                                           matchID=season['gw'].map(f'{i}{{:07d}}'.format))
+              for i in range(leagues)}
+    conn = mysqlconnect()
+    with conn.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE IF NOT EXISTS {database}')
+        cursor.execute(f'USE {database}')
+
+    def fresh_tables():
+        with conn.cursor() as cursor:
+            for table in ['leaderboard', 'player_window', 'player_stats', 'player_game', 'player', 'schema_version']:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.commit()
+        migrate(conn)
+        for frame in frames.values():
+            load_players(conn, frame.drop_duplicates('playerID')[['playerID', 'Player', 'Pos', 'Club', 'Nation', 'League']])
+
+    def load_league(sink, league):
+        for gw, gw_frame in frames[league].groupby('gw', sort=True):
+            sink.write(league, gw, gw_frame['matchID'].iloc[0], gw_frame.drop(columns='gw'))
+
+    results = {}
+    try:
+        for n in writers:
+            fresh_tables()
+            pool = ConnectionPool(n, config={**read_config(), 'db': database}) if n > 1 else None
+            sink = MySQLSink(conn, pool=pool)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=leagues) as executor:
+                list(executor.map(lambda league: load_league(sink, league), frames))
+            results[n] = time.perf_counter() - start
+            if pool is not None:
+                pool.close()
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+        conn.close()
+
+    rows = sum(map(len, frames.values()))
+    print(f'{leagues} leagues x {gws} gameweeks, {rows} player_game rows')
+    for n, elapsed in results.items():
+        label = 'one shared connection' if n == 1 else f'{n} pooled connections'
+        print(f'{label:<22} {elapsed:>7.2f} s {rows / elapsed:>9,.0f} rows/s ({results[writers[0]] / elapsed:.1f}x)')
+
+
+def bench_scoring(path, gws=38, leagues=5, repeat=5):
+    """Scoring a season of player_game rows for several leagues at once, then just its last gameweek"""
+    from scoring import score
+
+    season = season_frame(path, gws)
+    season = pd.concat([season.assign(League=f'League {i}', matchID=season['gw'].map('{:08d}'.format))
+                        for i in range(leagues)], ignore_index=True)
+    last = season[season['gw'] == gws]
+
+    full = incremental = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        points = score(season)
+        full = min(full, time.perf_counter() - start)
+        start = time.perf_counter()
+        score(last)
+        incremental = min(incremental, time.perf_counter() - start)
+    print(f'{len(season)} player matches ({leagues} leagues x {gws} gameweeks), {points["points"].sum():.0f} points')
+    print(f'full season:   {full * 1000:.1f} ms ({len(season) / full:,.0f} rows/s)')
+    print(f'last gameweek: {incremental * 1000:.1f} ms')
+
+
+def bench_search(path, players=2500, repeat=200):
+    """Building the player search index, reindexing a transfer window, and typical queries"""
+    from search import SearchIndex
+
+    # as many distinct names as the five leagues have, made up from the real first and last names
+    names = pd.read_csv(path)['Player'].drop_duplicates().str.split()
+    rng = np.random.default_rng(0)
+    first, last = rng.choice(names.str[0], players), rng.choice(names.str[-1], players)
+    frame = pd.DataFrame({'playerID': [f'{i:08x}' for i in range(players)],
+                          'Player': [f'{a} {b}' for a, b in zip(first, last)],
+                          'Pos': rng.choice(['GK', 'DF', 'MF', 'FW', 'DF,MF', 'MF,FW'], players),
+                          'Club': [f'Club {i % 100}' for i in range(players)],
+                          'League': [f'League {i % 5}' for i in range(players)]})
+
+    start = time.perf_counter()
+    index = SearchIndex.build(frame)
+    print(f'{players} players, {len(index.words)} name words: built in {(time.perf_counter() - start) * 1000:.1f} ms')
+    transfers = frame.sample(100, random_state=0).assign(Club='Club 0')
+    start = time.perf_counter()
+    index.update(transfers)
+    print(f'100 transfers reindexed in {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    # a long surname, so the typo still shares most of its trigrams
+    sample = max(last, key=len)
+    typo = sample[:3] + sample[4:]
+    queries = [('prefix', sample[:2], {}), ('word', sample, {}), ('typo', typo, {}),
+               ('full name', frame['Player'].iloc[0], {}), ('filtered', sample[:1], {'league': 'League 0', 'pos': 'MF'}),
+               ('filters only', '', {'club': 'Club 0'})]
+    print(f'{"query":<14} {"":<24} {"results":>7} {"mean ms":>8} {"max ms":>8}')
+    for name, query, filters in queries:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = index.search(query, **filters)
+            times.append(time.perf_counter() - start)
+        print(f'{name:<14} {query!r:<24} {len(results):>7} {np.mean(times) * 1000:>8.3f} {max(times) * 1000:>8.3f}')
+
+
+def corpus_file(site, url):
+    """Where a recorded page lives: its url path under site, ending in .html"""
+    path = urlsplit(url).path.strip('/') or 'index'
+    return os.path.join(site, path if path.endswith('.html') else path + '.html')
+
+
+def record_corpus(leagues, gws=(1,), profiles=20, root=CORPUS_DIR):
+    """Save what an ingest run downloads, per league: the schedule, the gameweeks'
+    match reports, the squad list and squad pages, and the first few player profiles
+
+    corpus.json lists the pages by url path, so the suite can serve them from
+    any host.
+    """
+    site = os.path.join(root, 'site')
+    corpus = {}
+    for league in leagues:
+        schedule_url, players_url = URLS[league]['matches'], URLS[league]['players']
+        schedule = scraping.get_schedule(schedule_url)
+        matches = {gw: schedule.match_urls(gw) for gw in gws}
+        squads = (HOME_URL[:-1] + scraping.get_dataframe(players_url, links=['Squad'])['Squad_link']).tolist()
+        players = []
+        for html in fetch_many(squads):
+            players += clean_columns(scraping.read_html(html)[0])['player_url'].tolist()
+        players = players[:profiles]
+
+        urls = [schedule_url, players_url] + [url for urls in matches.values() for url in urls] + squads + players
+        for url, html in zip(urls, fetch_many(urls)):
+            path = corpus_file(site, url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html)
+        corpus[league] = {
+            'schedule': urlsplit(schedule_url).path,
+            'players': urlsplit(players_url).path,
+            'matches': {str(gw): [urlsplit(url).path for url in urls] for gw, urls in matches.items()},
+            'squads': [urlsplit(url).path for url in squads],
+            'profiles': [urlsplit(url).path for url in players],
+        }
+        print(f'Saved {league}: {len(urls)} pages')
+
+    with open(os.path.join(root, 'corpus.json'), 'w') as f:
+        json.dump(corpus, f, indent=2)
+
+
+def fixture_corpus(path=os.path.join(FIXTURES_DIR, 'matches'), copies=10, root=CORPUS_DIR):
+    """Build a one-league corpus from the committed match report fixtures, so the suite runs offline
+
+    Each fixture is served copies times as gameweek 1 matches under fresh
+    ids, beside a schedule listing them, a squad list, a squad page per club
+    and a profile per player, all made from the players in the reports.
+    """
+    site = os.path.join(root, 'site')
+
+    def save(url_path, html):
+        file = corpus_file(site, url_path)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, 'w', encoding='utf-8') as f:
+            f.write(html)
+        return url_path
+
+    def cell(value, link=None):
+        return f'<td><a href="{link}">{value}</a></td>' if link else f'<td>{value}</td>'
+
+    fixtures, clubs, players, rows = load_fixtures(path), {}, {}, []
+    for n, html in enumerate(fixtures):
+        tree = lxml_html.fromstring(html)
+        squads = [(a.get('href'), ' '.join(a.text_content().split()))
+                  for a in tree.xpath('//div[contains(@class, "scorebox")]//strong/a[contains(@href, "/en/squads/")]')]
+        clubs.update(squads)
+        report = parse_match_report(html, url=f'{HOME_URL}en/matches/x{n:07d}/fixture')
+        frame = assemble([report])
+        for player in frame.drop_duplicates('playerID').itertuples(index=False):
+            players.setdefault(player.Club, {})[player.playerID] = player
+        canonical = tree.xpath('string(//link[@rel="canonical"]/@href)')
+        for copy in range(copies):
+            match_path = f'/en/matches/{n:04d}{copy:04d}/{squads[0][1]}-{squads[1][1]}'.replace(' ', '-')
+            save(match_path, html.replace(canonical, HOME_URL[:-1] + match_path))
+            rows.append((match_path, squads[0], squads[1]))
+
+    schedule = ''.join(f'<tr><th>1</th><td>2023-08-11</td>{cell(home[1], home[0])}{cell("1–1", match)}'
+                       f'{cell(away[1], away[0])}{cell("Match Report", match)}</tr>' for match, home, away in rows)
+    save('/comps/schedule.html', '<html><body><table><thead><tr><th>Wk</th><th>Date</th><th>Home</th><th>Score</th>'
+         f'<th>Away</th><th>Match Report</th></tr></thead><tbody>{schedule}</tbody></table></body></html>')
+    squad_list = ''.join(f'<tr><th>{i + 1}</th>{cell(name, link)}</tr>' for i, (link, name) in enumerate(clubs.items()))
+    save('/comps/stats.html', '<html><body><table><thead><tr><th>Rk</th><th>Squad</th></tr></thead>'
+         f'<tbody>{squad_list}</tbody></table></body></html>')
+
+    profiles = []
+    for link, name in clubs.items():
+        squad = ''.join(f'<tr><th><a href="{urlsplit(p.player_url).path}">{p.Player}</a></th>{cell(p.Nation)}'
+                        f'{cell(p.Pos)}{cell(int(p.Age))}{cell(1)}{cell(1)}{cell(p.Min)}</tr>'
+                        for p in players.get(name, {}).values())
+        save(link, '<html><body><table><thead><tr><th>Player</th><th>Nation</th><th>Pos</th><th>Age</th><th>MP</th>'
+             f'<th>Starts</th><th>Min</th></tr></thead><tbody>{squad}</tbody></table></body></html>')
+        profiles += [save(urlsplit(p.player_url).path, f'<html><body><div id="meta"><p><strong>Position:</strong> '
+                          f'{p.Pos}</p></div></body></html>') for p in players.get(name, {}).values()]
+
+    corpus = {'Fixtures': {
+        'schedule': '/comps/schedule.html',
+        'players': '/comps/stats.html',
+        'matches': {'1': [match for match, _, _ in rows]},
+        'squads': list(clubs),
+        'profiles': profiles,
+    }}
+    with open(os.path.join(root, 'corpus.json'), 'w') as f:
+        json.dump(corpus, f, indent=2)
+    print(f'Built a corpus of {len(rows)} matches, {len(clubs)} squads and {len(profiles)} profiles in {root}')
+
+
+def serve(root=CORPUS_DIR):
+    """Serve a recorded corpus from a free localhost port, returning the server and its base url"""
+    site = os.path.join(root, 'site')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                with open(corpus_file(site, unquote(self.path)), 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+def rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        # no procfs, so settle for the high-water mark (KB on linux, bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRSS:
+    """Samples RSS in a background thread for the length of a with block"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, rss())
+
+    def __enter__(self):
+        self.peak = rss()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss())
+
+
+def run_stage(func, items, repeat=1, mapper=map):
+    """Call func on every item repeat times, returning the last round's results and the stage's stats
+
+    mapper runs the calls, e.g. a thread pool's map to time concurrent fetches;
+    latencies are per call, throughput is calls over the stage's wall time.
+    """
+    items = list(items)
+    latencies = []
+
+    def timed(item):
+        start = time.perf_counter()
+        result = func(item)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    with PeakRSS() as peak:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = list(mapper(timed, items))
+        wall = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return results, {
+        'items': len(latencies),
+        'seconds': round(wall, 4),
+        'per_second': round(len(latencies) / wall, 2) if wall else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None,
+        'peak_rss_mb': round(peak.peak / 2 ** 20, 1),
+    }
+
+
+def mysql_stage(units, database='fantasy_bench'):
+    """Load every match's player_match batch into a scratch database as db.py does"""
+    from db import load_player_games, load_players, migrate, mysqlconnect
+
+    players = pd.concat([frame[['playerid', 'club', 'league']].astype(str) for _, _, _, frame in units])
+    conn = mysqlconnect()
+    with conn.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE IF NOT EXISTS {database}')
+        cursor.execute(f'USE {database}')
+        for table in ['player_stats', 'player_game', 'player', 'schema_version']:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.commit()
+    try:
+        migrate(conn)
+        load_players(conn, players.drop_duplicates('playerid'))
+        return run_stage(lambda unit: load_player_games(conn, unit[3], unit[1]), units)[1]
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+        conn.close()
+
+
+def firestore_stage(units, schedules):
+    """Write every match to the Firestore emulator as firestore.py does"""
+    import firestore
+
+    def write(unit):
+        league, gw, match, frame = unit
+        stats = firestore.write_match(league, gw, match, frame, schedules[league].fixture(match))
+        if stats['failed']:
+            raise RuntimeError(f'{stats["failed"]} firestore writes failed for match {match}')
+
+    return run_stage(write, units)[1]
+
+
+def bench_suite(root=CORPUS_DIR, repeat=3, mysql=False):
+    """Time every ingest stage against a recorded corpus served locally, returning the results as a dict
+
+    The Firestore stage runs when FIRESTORE_EMULATOR_HOST points at an
+    emulator, the MySQL one with mysql=True (it loads a scratch database).
+    Without a recorded corpus one is built from the committed fixtures.
+    """
+    if not os.path.exists(os.path.join(root, 'corpus.json')):
+        fixture_corpus(root=root)
+    with open(os.path.join(root, 'corpus.json')) as f:
+        corpus = json.load(f)
+    server, base = serve(root)
+
+    # links in the recorded pages resolve against the local server, with no rate limit or cache in the way
+    scraping.HOME_URL = match_report.HOME_URL = base
+    fetcher = fetch.configure(host_limits={}, cache=None)
+    url = lambda path: base + path.lstrip('/')
+
+    schedules = {league: url(pages['schedule']) for league, pages in corpus.items()}
+    matches = [(league, int(gw), url(path)) for league, pages in corpus.items()
+               for gw, paths in pages['matches'].items() for path in paths]
+    squads = [url(path) for pages in corpus.values() for path in pages['squads']]
+    profiles = [url(path) for pages in corpus.values() for path in pages['profiles']]
+    pages = list(schedules.values()) + [url(pages['players']) for pages in corpus.values()] \
+        + [match for _, _, match in matches] + squads + profiles
+
+    stages = {}
+    try:
+        html, stages['fetch'] = run_stage(fetcher.fetch, pages, repeat, mapper=fetcher.executor.map)
+        html = dict(zip(pages, html))
+        indexes, stages['schedule'] = run_stage(scraping.ScheduleIndex, schedules.values(), repeat)
+        indexes = dict(zip(schedules, indexes))
+        reports, stages['parse'] = run_stage(lambda match: parse_match_report(html[match[2]], url=match[2]), matches, repeat)
+        _, stages['assemble'] = run_stage(lambda report: assemble([report]), reports, repeat)
+        frames, stages['clean'] = run_stage(lambda unit: scraping.player_match_frame([unit[1]], unit[0][0], unit[0][1]),
+                                            zip(matches, reports), repeat)
+        _, stages['squad'] = run_stage(lambda squad: clean_columns(scraping.read_html(html[squad])[0]), squads, repeat)
+        _, stages['profile'] = run_stage(lambda profile: scraping.parse_player_pos(html[profile]), profiles, repeat)
+
+        units = [(league, gw, report.match_id, frame) for (league, gw, _), report, frame in zip(matches, reports, frames)]
+        if mysql:
+            stages['mysql'] = mysql_stage(units)
+        if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+            stages['firestore'] = firestore_stage(units, indexes)
+    finally:
+        server.shutdown()
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'corpus': {'leagues': len(corpus), 'pages': len(pages), 'matches': len(matches),
+                   'squads': len(squads), 'profiles': len(profiles)},
+        'stages': stages,
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Each stage metric that's worse than the baseline by more than tolerance, as a line of text"""
+    regressions = []
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if not base:
+            continue
+        for metric in ['p50_ms', 'p95_ms', 'peak_rss_mb']:
+            if metric.endswith('_ms') and stage[metric] - base[metric] < MIN_DELTA_MS:
+                continue
+            if base[metric] and stage[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {base[metric]} -> {stage[metric]} (+{stage[metric] / base[metric] - 1:.0%})')
+        if base['per_second'] and stage['per_second'] < base['per_second'] * (1 - tolerance):
+            regressions.append(f'{name} per_second: {base["per_second"]} -> {stage["per_second"]} '
+                               f'({stage["per_second"] / base["per_second"] - 1:.0%})')
+    return regressions
+
+
+def print_suite(results):
+    print(f'{results["corpus"]["pages"]} pages, {results["corpus"]["matches"]} matches, '
+          f'{results["repeat"]} rounds on {results["cpus"]} cpus')
+    print(f'{"stage":<10} {"items":>6} {"per s":>9} {"p50 ms":>9} {"p95 ms":>9} {"peak MB":>8}')
+    for name, stage in results['stages'].items():
+        print(f'{name:<10} {stage["items"]:>6} {stage["per_second"]:>9.1f} {stage["p50_ms"]:>9.2f} '
+              f'{stage["p95_ms"]:>9.2f} {stage["peak_rss_mb"]:>8.1f}')
+
+
+def bench_api(url='http://127.0.0.1:8080', paths=('/players', '/stats'), concurrency=50, requests=5000,
+              conditional=False):
+    """Requests per second and latency percentiles of a running api.py, concurrency requests at a time
+
+    Paths are requested round robin. With conditional=True each client sends
+    back the ETag it last got, so the run measures 304 revalidations.
+    """
+    import asyncio
+    from collections import Counter
+
+    import aiohttp
+
+    async def run():
+        latencies, statuses, etags = [], Counter(), {}
+        remaining = iter(range(requests))
+
+        async def client(session):
+            for i in remaining:
+                path = paths[i % len(paths)]
+                headers = {'If-None-Match': etags[path]} if conditional and path in etags else {}
+                start = time.perf_counter()
+                try:
+                    async with session.get(url + path, headers=headers) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                        if 'ETag' in response.headers:
+                            etags[path] = response.headers['ETag']
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+            return time.perf_counter() - start, latencies, statuses
+
+    elapsed, latencies, statuses = asyncio.run(run())
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    print(f'{len(latencies)} requests to {url} over {", ".join(paths)}, {concurrency} at a time'
+          + (', revalidating' if conditional else ''))
+    print(f'{len(latencies) / elapsed:,.0f} requests/s  p50 {p50:.2f} ms  p95 {p95:.2f} ms  p99 {p99:.2f} ms')
+    print('status ' + '  '.join(f'{status}: {n}' for status, n in sorted(statuses.items(), key=str)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('record').add_argument('urls', nargs='+')
+    sub.add_parser('parse').add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, 'matches'))
+    sub.add_parser('check').add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, 'matches'))
+    pipeline_parser = sub.add_parser('pipeline')
+    pipeline_parser.add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, 'matches'))
+    pipeline_parser.add_argument('--matches', type=int, default=40)
+    pipeline_parser.add_argument('--latency', type=float, default=0.05)
+    pipeline_parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    assemble_parser = sub.add_parser('assemble')
+    assemble_parser.add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, 'matches'))
+    assemble_parser.add_argument('--matches', type=int, default=10)
+    sub.add_parser('clean').add_argument('--csv', default='data/match_data/gw1.csv')
+    bulk_parser = sub.add_parser('bulk')
+    bulk_parser.add_argument('--csv', default='data/match_data/gw1.csv')
+    bulk_parser.add_argument('--gws', type=int, default=38)
+    stats_parser = sub.add_parser('stats')
+    stats_parser.add_argument('--csv', default='data/match_data/gw1.csv')
+    stats_parser.add_argument('--gws', type=int, default=38)
+    writers_parser = sub.add_parser('writers')
+    writers_parser.add_argument('--csv', default='data/match_data/gw1.csv')
+    writers_parser.add_argument('--leagues', type=int, default=4)
+    writers_parser.add_argument('--gws', type=int, default=10)
+    writers_parser.add_argument('--writers', type=int, nargs='+', default=[1, 2, 4])
+    scoring_parser = sub.add_parser('scoring')
+    scoring_parser.add_argument('--csv', default='data/match_data/gw1.csv')
+    scoring_parser.add_argument('--gws', type=int, default=38)
+    scoring_parser.add_argument('--leagues', type=int, default=5)
+    search_parser = sub.add_parser('search')
+    search_parser.add_argument('--csv', default='data/match_data/gw1.csv')
+    search_parser.add_argument('--players', type=int, default=2500)
+    corpus_parser = sub.add_parser('corpus')
+    corpus_parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=['Premier League'])
+    corpus_parser.add_argument('--gws', nargs='+', type=int, default=[1])
+    corpus_parser.add_argument('--profiles', type=int, default=20)
+    corpus_parser.add_argument('--root', default=CORPUS_DIR)
+    corpus_parser.add_argument('--fixtures', action='store_true', help='build the corpus from the committed match fixtures')
+    corpus_parser.add_argument('--copies', type=int, default=10, help='matches served per fixture with --fixtures')
+    suite_parser = sub.add_parser('suite')
+    suite_parser.add_argument('--root', default=CORPUS_DIR)
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--mysql', action='store_true', help='time loading a scratch database (needs sql.config)')
+    suite_parser.add_argument('--json', action='store_true', help='print the results as json instead of a table')
+    suite_parser.add_argument('--out', help='also write the results as json to this file')
+    suite_parser.add_argument('--baseline', default=BASELINE_PATH)
+    suite_parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    suite_parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    api_parser = sub.add_parser('api')
+    api_parser.add_argument('--url', default='http://127.0.0.1:8080')
+    api_parser.add_argument('--paths', nargs='+', default=['/players', '/stats'])
+    api_parser.add_argument('--concurrency', type=int, default=50)
+    api_parser.add_argument('--requests', type=int, default=5000)
+    api_parser.add_argument('--conditional', action='store_true', help='send If-None-Match with the last ETag seen')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.urls)
+    elif args.command == 'parse':
+        bench_parse(args.fixtures)
+    elif args.command == 'check':
+        check_assemble(args.fixtures)
+    elif args.command == 'pipeline':
+        bench_pipeline(args.fixtures, args.matches, args.latency, args.workers)
+    elif args.command == 'assemble':
+        bench_assemble(args.fixtures, args.matches)
+    elif args.command == 'clean':
+        bench_clean(args.csv)
+    elif args.command == 'bulk':
+        bench_bulk(args.csv, args.gws)
+    elif args.command == 'stats':
+        bench_stats(args.csv, args.gws)
+    elif args.command == 'writers':
+        bench_writers(args.csv, args.leagues, args.gws, args.writers)
+    elif args.command == 'scoring':
+        bench_scoring(args.csv, args.gws, args.leagues)
+    elif args.command == 'search':
+        bench_search(args.csv, args.players)
+    elif args.command == 'corpus':
+        if args.fixtures:
+            fixture_corpus(copies=args.copies, root=args.root)
+        else:
+            record_corpus(args.leagues, args.gws, args.profiles, args.root)
+    elif args.command == 'api':
+        bench_api(args.url, args.paths, args.concurrency, args.requests, args.conditional)
+    elif args.command == 'suite':
+        results = bench_suite(args.root, args.repeat, args.mysql)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_suite(results)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2)
+
+        if args.save_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+        elif os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                print('Regressions against ' + args.baseline, *regressions, sep='\n  ', file=sys.stderr)
+                raise SystemExit(1)
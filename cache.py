@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = 'data/cache'
+MAX_BYTES = 2 * 1024 ** 3
+
+# how long each class of fbref page stays fresh, first match wins. a match
+# report is only fetched once the game has a score, so it never changes;
+# None means the entry never expires.
+TTLS = [
+    (re.compile(r'/en/matches/'), None),
+    (re.compile(r'/schedule/'), 6 * 60 * 60),
+    (re.compile(r'/en/squads/'), 24 * 60 * 60),
+    (re.compile(r'/en/players/'), 7 * 24 * 60 * 60),
+    (re.compile(r'/en/comps/'), 24 * 60 * 60),
+]
+DEFAULT_TTL = 60 * 60
+
+
+class CacheMiss(KeyError):
+    """Raised in offline mode when a url has never been cached"""
+
+
+def ttl_for(url):
+    for pattern, ttl in TTLS:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+class ResponseCache:
+    """Content-addressed, gzip-compressed on-disk cache of fetched pages
+
+    Bodies are stored once per sha256 digest under objects/, and a small
+    sqlite index maps each url to its digest, validators and access time
+    so the cache can be revalidated and trimmed least-recently-used first.
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=MAX_BYTES, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+        self.conn.commit()
+
+    def object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.gz')
+
+    def lookup(self, url):
+        """Return (body, fresh, validators) for a cached url, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT digest, etag, last_modified, fetched_at FROM entries WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        digest, etag, last_modified, fetched_at = row
+        try:
+            with gzip.open(self.object_path(digest), 'rt', encoding='utf-8') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+
+        ttl = ttl_for(url)
+        fresh = ttl is None or time.time() - fetched_at < ttl
+        validators = {}
+        if etag:
+            validators['If-None-Match'] = etag
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+        self.touch(url, refreshed=False)
+        return body, fresh, validators
+
+    def touch(self, url, refreshed=True):
+        # bump the access time, and the fetch time too after a 304
+        now = time.time()
+        with self.lock:
+            if refreshed:
+                self.conn.execute('UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            else:
+                self.conn.execute('UPDATE entries SET accessed_at = ? WHERE url = ?', (now, url))
+            self.conn.commit()
+
+    def store(self, url, body, etag=None, last_modified=None):
+        data = body.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+
+        # identical pages share one object on disk
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, digest, os.path.getsize(path), etag, last_modified, now, now))
+            self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT digest, MAX(size) FROM entries GROUP BY digest').fetchall()
+            total = sum(size for _, size in rows)
+            if total <= self.max_bytes:
+                return
+
+            for url, digest, size in self.conn.execute(
+                    'SELECT url, digest, size FROM entries ORDER BY accessed_at').fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute('DELETE FROM entries WHERE url = ?', (url,))
+
+                # only remove the object once no other url points at it
+                if not self.conn.execute('SELECT 1 FROM entries WHERE digest = ?', (digest,)).fetchone():
+                    try:
+                        os.remove(self.object_path(digest))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -1,355 +1,367 @@
-import pymysql
-import requests
+import argparse
+import os
+import queue
+import tempfile
+import threading
 import time
-from bs4 import BeautifulSoup as bs
-from scraping import get_match_data, get_player_data
-
-HOME_URL = 'https://fbref.com/'
-URLS = {
-    'Premier League': {
-        'matches': 'https://fbref.com/en/comps/9/schedule/Premier-League-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/9/Premier-League-Stats'
-    },
-    'La Liga': {
-        'matches': 'https://fbref.com/en/comps/12/schedule/La-Liga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/12/La-Liga-Stats'
-    },
-    'Serie A': {
-        'matches': 'https://fbref.com/en/comps/11/schedule/Serie-A-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/11/Serie-A-Stats'
-    },
-    'Bundesliga': {
-        'matches': 'https://fbref.com/en/comps/20/schedule/Bundesliga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/20/Bundesliga-Stats'}
-}
+from contextlib import contextmanager
+from functools import lru_cache
 
+import pymysql
+from ingest import MAX_LEAGUES, ingest_matches, ingest_players
+from leagues import URLS
+from manifest import get_manifest
+from metrics import count, finish, timed
+from migrations import GAME_COLS, TABLES, migrate, quote, stat_cols
+from sinks import MySQLSink
+
+BATCH_SIZE = 1000
+
+# connections a pool opens at most, how long a checkout waits for one, and how long
+# one can sit idle before it's pinged on checkout
+POOL_SIZE = 4
+POOL_TIMEOUT = 30
+PING_AFTER = 60
+
+# innodb deadlock and lock wait timeout; the loads are idempotent, so they're run again
+RETRY_ERRORS = {1205, 1213}
+LOCK_RETRIES = 3
+
+# scraping returns firestore-style names; these are the sql columns they load into
+SQL_NAMES = {
+    'ID': 'playerID', 'playerid': 'playerID', 'matchid': 'matchID', 'name': 'Player', 'position': 'Pos',
+    'club': 'Club', 'league': 'League', 'nation': 'Nation', 'age': 'Age', 'matches': 'MP',
+    'starts': 'Starts', 'mins': 'Min'
+}
 
-def mysqlconnect():
 
-    # read in db connection info
-    with open('sql.config', 'r') as f:
+@lru_cache()
+def read_config(path='sql.config'):
+    """Connection settings from sql.config as {host, user, password, db}, read once per path"""
+    with open(path, 'r') as f:
         host = f.readline().split(': ')[1].strip()
         user = f.readline().split(': ')[1].strip()
         password = f.readline().split(': ')[1].strip()
         db = f.readline().split(': ')[1].strip()
+    return {'host': host, 'user': user, 'password': password, 'db': db}
+
+
+def mysqlconnect(local_infile=False):
 
     # connect to database
     conn = pymysql.connect(
-        host=host,
-        user=user,
-        password=password,
-        db=db
+        **read_config(),
+        local_infile=local_infile
     )
 
     return conn
 
 
-def sql_cols(df):
-    dtypes = [str(x) for x in df.dtypes.tolist()]
-    subs = {'int64': 'INT DEFAULT 0', 'float64': 'FLOAT DEFAULT 0', 'object': 'VARCHAR(255)'}
-    subs_dct = {k: v for k, v in subs.items()}
-    dtypes = [subs_dct.get(item, item) for item in dtypes]
-    sql_cols = zip(df.columns, dtypes)
-    return sql_cols
-
-
-def add_pos_triggers(conn):
-    # create trigger that updates Pos in player_game and player_stats on insert to player table
+class ConnectionPool:
+    """A bounded set of connections for loaders writing side by side
+
+    connection() hands out the most recently returned idle connection,
+    pinging it first if it sat idle longer than ping_after and replacing it
+    if that fails. Below size connections it opens a new one; at size it
+    waits up to timeout for one to come back. A connection is rolled back
+    when the block using it raises, and dropped if even that fails.
+    """
+
+    def __init__(self, size=POOL_SIZE, local_infile=False, timeout=POOL_TIMEOUT, ping_after=PING_AFTER, config=None):
+        self.config = {**(config or read_config()), 'local_infile': local_infile}
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def checkout(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f'all {self.size} mysql connections still busy after {self.timeout}s')
+        try:
+            try:
+                conn, returned = self.idle.get_nowait()
+            except queue.Empty:
+                return pymysql.connect(**self.config)
+            if time.monotonic() - returned > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.err.Error:
+                    count(reconnects=1)
+                    conn.close()
+                    conn = pymysql.connect(**self.config)
+            return conn
+        except Exception:
+            self.slots.release()
+            raise
+
+    def checkin(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except pymysql.err.Error:
+                pass
+        else:
+            self.idle.put((conn, time.monotonic()))
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except pymysql.err.Error:
+                broken = True
+            raise
+        finally:
+            self.checkin(conn, broken)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+
+def retry_locks(load, retries=LOCK_RETRIES):
+    """Run load(), again if it was picked as a deadlock victim or timed out waiting for a lock"""
+    for attempt in range(retries + 1):
+        try:
+            return load()
+        except pymysql.err.OperationalError as e:
+            if e.args[0] not in RETRY_ERRORS or attempt == retries:
+                raise
+            count(lock_retries=1)
+            time.sleep(0.1 * 2 ** attempt)
+
+
+def to_table(df, table):
+    """Keep the columns a registered table has, spelled the way it spells them"""
+    names = {col.lower(): col for col, _ in TABLES[table]['columns']}
+    dropped = [col for col in df.columns if col.lower() not in names]
+    if dropped:
+        print(f'{table} has no column for {", ".join(dropped)}, skipping them')
+    return df[[col for col in df.columns if col.lower() in names]].rename(columns=lambda col: names[col.lower()])
+
+
+def bulk_insert(conn, table, df, keys, batch_size=BATCH_SIZE, on_duplicate='update', local_infile=False):
+    """Load a dataframe in multi-row batches
+
+    Rows whose keys already exist are updated (on_duplicate='update') or
+    left alone ('skip'). With local_infile each batch is staged to a file,
+    loaded into a temporary copy of the table with LOAD DATA LOCAL INFILE and
+    inserted from there the same way, which needs a connection opened with
+    mysqlconnect(local_infile=True). Prints and returns the number of rows
+    inserted, updated and skipped.
+    """
+    cols = df.columns.tolist()
+    col_list = ', '.join(quote(col) for col in cols)
+    updates = ', '.join(f'{quote(col)} = VALUES({quote(col)})' for col in cols if col not in keys)
+    if on_duplicate == 'update':
+        insert, tail = f'INSERT INTO {table} ({col_list})', f' ON DUPLICATE KEY UPDATE {updates}'
+    else:
+        insert, tail = f'INSERT IGNORE INTO {table} ({col_list})', ''
+    sql = f'{insert} VALUES ({", ".join(["%s"] * len(cols))}){tail}'
+
+    # NaN can't be sent to mysql, send NULL instead
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+    key_idx = [cols.index(key) for key in keys]
+    key_match = f'({", ".join(quote(key) for key in keys)}) IN ({{}})'
+
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
     with conn.cursor() as cursor:
-        trigger_code = """
-        CREATE TRIGGER IF NOT EXISTS update_pos_onIns AFTER INSERT ON player
-        FOR EACH ROW
-        BEGIN
-            UPDATE player_game
-            SET Pos = NEW.Pos
-            WHERE playerID = NEW.playerID;
-
-            UPDATE player_stats
-            SET Pos = NEW.Pos
-            WHERE playerID = NEW.playerID;
-        END;
-        """
-        cursor.execute(trigger_code)
-
-        # create the same trigger for updates
-        trigger_code = """
-        CREATE TRIGGER IF NOT EXISTS update_pos_onUpd AFTER UPDATE ON player
-        FOR EACH ROW
-        BEGIN
-            UPDATE player_game
-            SET Pos = NEW.Pos
-            WHERE playerID = NEW.playerID;
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            with timed('db_batch', table=table) as unit:
+                # count the keys already present so affected rows can be split into inserts and updates
+                placeholders = ', '.join(['(' + ', '.join(['%s'] * len(keys)) + ')'] * len(batch))
+                cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE ' + key_match.format(placeholders),
+                               [row[i] for row in batch for i in key_idx])
+                existing = cursor.fetchone()[0]
+
+                if local_infile:
+                    affected = load_infile(cursor, table, cols, batch, insert, tail)
+                else:
+                    affected = cursor.executemany(sql, batch)
+                conn.commit()
 
-            UPDATE player_stats
-            SET Pos = NEW.Pos
-            WHERE playerID = NEW.playerID;
-        END;
-        """
-        cursor.execute(trigger_code)
-    conn.commit()
+                # mysql counts 1 per inserted row and 2 per updated (or replaced) row
+                inserted = len(batch) - existing
+                if on_duplicate == 'update':
+                    updated = (affected - inserted) // 2
+                else:
+                    inserted, updated = affected, 0
+                stats = {'inserted': inserted, 'updated': updated, 'skipped': len(batch) - inserted - updated}
+                unit.count(rows=len(batch), **stats)
+            for k, v in stats.items():
+                totals[k] += v
+            print(f'{table} batch {start // batch_size + 1}: {stats["inserted"]} inserted, '
+                  f'{stats["updated"]} updated, {stats["skipped"]} skipped')
+    return totals
+
+
+def load_infile(cursor, table, cols, rows, insert, tail=''):
+    """Stage rows to a tab-separated file, LOAD DATA LOCAL INFILE it into a temporary copy of table, then
+    run insert ... SELECT from there, returning the affected row count
+
+    Going through the copy keeps ON DUPLICATE KEY UPDATE semantics: LOAD
+    DATA's own REPLACE deletes and reinserts rows, which the foreign keys
+    on player fail, and counts rows differently.
+    """
+    staging = f'{table}_staging'
+    col_list = ', '.join(quote(col) for col in cols)
+    # just the loaded columns, so columns the batch leaves out can't trip NOT NULL in the copy
+    cursor.execute(f'DROP TEMPORARY TABLE IF EXISTS {staging}')
+    cursor.execute(f'CREATE TEMPORARY TABLE {staging} SELECT {col_list} FROM {table} LIMIT 0')
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            for row in rows:
+                f.write('\t'.join('\\N' if v is None else str(v).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ')
+                                  for v in row) + '\n')
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {staging} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({col_list})",
+            (path,))
+    finally:
+        os.remove(path)
+    affected = cursor.execute(f'{insert} SELECT {col_list} FROM {staging}{tail}')
+    cursor.execute(f'DROP TEMPORARY TABLE {staging}')
+    return affected
 
 
 def update_pos(conn):
-    # write a procedure that updates all Pos in player_game and player_stats
+    # write a procedure that updates Pos in player_game and player_stats where it differs from player
     with conn.cursor() as cursor:
         procedure_code = """
-        CREATE PROCEDURE IF NOT EXISTS update_pos()
+        CREATE PROCEDURE update_pos()
         BEGIN
-            UPDATE player_game
-            SET Pos = (SELECT Pos FROM player WHERE playerID = player_game.playerID);
+            UPDATE player_game g JOIN player p ON p.playerID = g.playerID
+            SET g.Pos = p.Pos
+            WHERE NOT g.Pos <=> p.Pos;
 
-            UPDATE player_stats
-            SET Pos = (SELECT Pos FROM player WHERE playerID = player_stats.playerID);
+            UPDATE player_stats s JOIN player p ON p.playerID = s.playerID
+            SET s.Pos = p.Pos
+            WHERE NOT s.Pos <=> p.Pos;
         END;
         """
+        cursor.execute('DROP PROCEDURE IF EXISTS update_pos;')
         cursor.execute(procedure_code)
-        cursor.execute('CALL update_pos();')
-    conn.commit()
 
-
-def create_player_game_table(conn, gw_map):
-
-    # iterate through each league and according gameweek
-    for league, gws in gw_map.items():
-
-        # check if gws is a string
-        if type(gws) == str: 
-            gws = [gws]
-
-        # get list of gameweeks based on input
-        elif len(gws) == 1:
-            gws = list(range(1, gws[0] + 1))
-        for gw in gws:
-            match_df = get_match_data(URLS[league]['matches'], gw=gw, league=league)
-            match_df['League'] = league
-
-            # create player_game table if it doesn't exist
-            match_cols = sql_cols(match_df)
-            col_insert = ', '.join([' '.join(x) for x in match_cols])
-            counter = 0
-            with conn.cursor() as cursor:
-                counter += 1
-                player_game = f'CREATE TABLE IF NOT EXISTS player_game ({col_insert} , PRIMARY KEY (playerID, gw), CONSTRAINT player_game_fk FOREIGN KEY (playerID) REFERENCES player(playerID));'
-                cursor.execute(player_game)
-
-            # add pos triggers
-            add_pos_triggers(conn)
-                
-            # create player_stats table if it doesn't exist and commit
-            cols = match_df.columns
-            create_player_stats_table(conn, cols)
-            conn.commit()
-
-            with conn.cursor() as cursor:
-
-                # insert data from dataframe into sql
-                sql = f'INSERT INTO player_game ({", ".join(cols)}) VALUES ({", ".join(["%s"] * len(cols))})'
-                for row in match_df.itertuples(index=False):
-                    values = tuple(row)
-                    try:
-                        cursor.execute(sql, values)
-                    except pymysql.err.IntegrityError:
-                        print(
-                            f'Duplicate entry found: {values[1]} ({values[2]})\nSkipping...\n')
-                        continue
-                conn.commit()
-            print(f'Imported into player_game ({league}, GW {gw})\n-----------------')
+        # only Pos changes, which the procedure writes to player_stats itself, so
+        # the per-row stats triggers would just recompute the same totals
+        cursor.execute('SET @bulk_load = 1;')
+        try:
+            cursor.execute('CALL update_pos();')
+        finally:
+            cursor.execute('SET @bulk_load = NULL;')
+    conn.commit()
 
 
-def create_player_table(conn):
-    # create player table if it doesn't exist
-    for league in URLS.keys():
-        if league != 'Bundesliga':
-            continue
-        player_df = get_player_data(URLS[league]['players'], league=league)
-        player_df['League'] = league
-        player_cols = sql_cols(player_df)
+def create_player_game_table(conn, gw_map, batch_size=BATCH_SIZE, local_infile=False, manifest=None, incremental=False,
+                             writers=1):
+    """Load {league: gameweeks} into player_game, one committed match at a time
+
+    Scraping and loading go through ingest with mysql as the only sink; use
+    ingest.py directly to load other sinks from the same scrape. With
+    writers > 1 leagues load side by side, each on its own pooled
+    connection; a league's matches still commit in order.
+    """
+    pool = ConnectionPool(writers, local_infile=local_infile) if writers > 1 else None
+    sink = MySQLSink(conn, batch_size=batch_size, local_infile=local_infile, pool=pool)
+    try:
+        failed = ingest_matches(gw_map, [sink], manifest=manifest, incremental=incremental,
+                                max_leagues=max(writers, MAX_LEAGUES))
+    finally:
+        if pool is not None:
+            pool.close()
+    if failed:
+        raise RuntimeError(f'{failed} player_game batches failed to load')
+
+
+def load_player_games(conn, match_df, gw, batch_size=BATCH_SIZE, local_infile=False):
+    """Load a batch of player_match rows into player_game and refresh the players' stats"""
+    # player_game's Pos is the player's, kept in step by triggers, not the one played in the match
+    match_df = match_df.drop(columns=['match_position', 'is_home'], errors='ignore').rename(columns=SQL_NAMES)
+    match_df.insert(1, 'gw', gw)
+    match_df = to_table(match_df, 'player_game')
+
+    # insert data from dataframe into sql, skipping rows already loaded. the
+    # per-row stats triggers are off for the load; the players it touched
+    # are re-aggregated in one pass afterwards
+    with conn.cursor() as cursor:
+        cursor.execute('SET @bulk_load = 1;')
+    try:
+        bulk_insert(conn, 'player_game', match_df, ['playerID', 'gw'], batch_size=batch_size,
+                    on_duplicate='skip', local_infile=local_infile)
+    finally:
         with conn.cursor() as cursor:
-            player = 'CREATE TABLE IF NOT EXISTS player ({}'.format(
-                ', '.join([' '.join(x) for x in player_cols])) + ', PRIMARY KEY (playerID));'
-            cursor.execute(player)
-        conn.commit()
+            cursor.execute('SET @bulk_load = NULL;')
+    refresh_player_stats(conn, match_df['playerID'], batch_size=batch_size)
 
-        #  print message confirming table is created
-        print("Created player table\n--------------------------")
 
-        # change player_df column order
-        player_df = player_df[['playerID', 'player_url', 'Player', 'Pos', 'Club', 'League', 'Nation', 'Num', 'Age', 'MP', 'Starts', 'Min']]
+def load_players(conn, player_df, batch_size=BATCH_SIZE, local_infile=False):
+    """Load one league's player rows into player"""
+    player_df = to_table(player_df.rename(columns=SQL_NAMES), 'player')
 
-        # insert data from dataframe into sql
-        cols = player_df.columns
+    # insert data from dataframe into sql; players already loaded take their current club from the squad page.
+    # the Pos triggers copy positions into player_game, so its per-row stats triggers are off for the load
+    # and the players' stats are refreshed in one pass afterwards
+    with conn.cursor() as cursor:
+        cursor.execute('SET @bulk_load = 1;')
+    try:
+        bulk_insert(conn, 'player', player_df, ['playerID'], batch_size=batch_size, local_infile=local_infile)
+    finally:
         with conn.cursor() as cursor:
+            cursor.execute('SET @bulk_load = NULL;')
+    refresh_player_stats(conn, player_df['playerID'], batch_size=batch_size)
 
-            # insert data from dataframe into sql
-            sql = f'INSERT INTO player ({", ".join(cols)}) VALUES ({", ".join(["%s"] * len(cols))})'
-            for row in player_df.itertuples(index=False):
-                values = tuple(row)
-                try:
-                    cursor.execute(sql, values)
-                except pymysql.err.IntegrityError:
-                    print(
-                        f'Duplicate entry found: {values[0]} ({values[1]}), {values[2]}\nUpdating club...\n')
-
-                    # scrape player's individual page and find current club, update accordingly
-
-                    player_url = f'{HOME_URL}/en/players/{values[1]}/{"-".join(values[0].split(" "))}'
 
-                    # find player's current club
-                    player_page = requests.get(player_url).text
-                    player_soup = bs(player_page, 'html.parser')
-                    club = player_soup.find(
-                        'strong', string=lambda x: x and x == 'Club:').parent.find('a').text.replace('&', 'and')
+def create_player_table(conn, batch_size=BATCH_SIZE, local_infile=False, leagues=('Bundesliga',)):
+    sink = MySQLSink(conn, batch_size=batch_size, local_infile=local_infile)
+    if ingest_players(leagues, [sink]):
+        raise RuntimeError('player table failed to load')
 
-                    update_sql = f'UPDATE player SET Club = %s WHERE playerID = %s'
-                    cursor.execute(update_sql, (club, values[1]))
 
-                    # wait for 3 seconds to avoid being blocked
-                    time.sleep(3)
-                    continue
+def refresh_player_stats(conn, player_ids, cols=GAME_COLS, batch_size=BATCH_SIZE):
+    """Recompute player_stats for just the given players
 
-            conn.commit()
-        print(f'Imported into player ({league})\n-----------------\n\n')
+    One grouped INSERT ... SELECT per batch of ids rebuilds each player's
+    totals and averages from their player_game rows, so a load costs the
+    same however far into the season it is.
+    """
+    sum_cols, avg_cols = stat_cols(cols)
+    targets = ['playerID', 'Pos', 'Club', 'League'] + sum_cols + avg_cols
+    aggs = [f'SUM(g.{quote(col)})' for col in sum_cols] + [f'AVG(g.{quote(col)})' for col in avg_cols]
+    updates = ', '.join(f'{quote(col)} = VALUES({quote(col)})' for col in targets[1:])
 
-
-def create_player_stats_table(conn, cols):
-
-    # create table with all the same columns as player_game table, but with playerID as foreign key from player table and without the gameweek and player columns
+    ids = list(dict.fromkeys(player_ids))
     with conn.cursor() as cursor:
-        # create table with all the same columns as player_game table, but with playerID as foreign key from player table and without the columns gw, Player, Nation, Club, Num, Pos, Age
-        # Drop table if it exists
-        cursor.execute(
-            'CREATE TABLE IF NOT EXISTS player_stats LIKE player_game;')
-        
-        # add pos column with varchar(255) type if it doesn't exist
-        cursor.execute("""
-            SELECT COUNT(*) INTO @pos_count
-            FROM information_schema.columns
-            WHERE table_schema = 'fantasy'
-            AND table_name = 'player_stats'
-            AND column_name = 'Pos';
-        """)
-        cursor.execute("""
-            SET @pos_statement = IF(@pos_count = 0,
-                'ALTER TABLE player_stats
-                ADD COLUMN Pos VARCHAR(255) AFTER player_url;',
-                'SELECT "Column already exists."'
-            );
-        """)
-
-        # check if gw is in cols, drop if it is
-        cursor.execute("""
-            SELECT COUNT(*) INTO @gw_count
-            FROM information_schema.columns
-            WHERE table_schema = 'fantasy'
-            AND table_name = 'player_stats'
-            AND column_name = 'gw';
-        """)
-        cursor.execute("""
-            SET @gw_statement = IF(@gw_count = 1,
-                'ALTER TABLE player_stats
-                DROP COLUMN gw;',
-                'SELECT "Column does not exist."'
-            );
-        """)
-        cursor.execute("PREPARE stmt FROM @gw_statement;")
-        cursor.execute("EXECUTE stmt;")
-        cursor.execute("DEALLOCATE PREPARE stmt;")
-
-
-        # check if foreign key exists, add it if it doesn't
-        cursor.execute("""
-            SELECT COUNT(*) INTO @fk_count
-            FROM information_schema.TABLE_CONSTRAINTS
-            WHERE CONSTRAINT_SCHEMA = 'fantasy'
-            AND CONSTRAINT_NAME = 'player_stats_fk';
-        """)
-        cursor.execute("""
-            SET @fk_statement = IF(@fk_count = 0,
-                'ALTER TABLE player_stats
-                ADD CONSTRAINT player_stats_fk FOREIGN KEY (playerID) REFERENCES player(playerID);',
-                'SELECT "Foreign key already exists.";'
-            );
-        """)
-        cursor.execute("PREPARE stmt FROM @fk_statement;")
-        cursor.execute("EXECUTE stmt;")
-        cursor.execute("DEALLOCATE PREPARE stmt;")
-        conn.commit()
-
-        # Define the column names for summing and averaging
-        non_cols = ['Player', 'Pos', 'gw', 'Nation',
-                    'Club', 'League', 'Num', 'Age', 'playerID', 'player_url']
-        sum_cols = [col for col in cols if col not in non_cols and 'pct' not in col.lower(
-        ) and 'avg' not in col.lower()]
-        avg_cols = [col for col in cols if col not in non_cols and (
-            'pct' in col.lower() or 'avg' in col.lower())]
-
-        # procedure for checking if players are in player_stats, adding if not
-        player_procedure = """
-        CREATE PROCEDURE IF NOT EXISTS insert_player_stats (playerIDVar varchar(255))
-        BEGIN
-            -- Check if playerID exists in player_stats table
-            IF NOT EXISTS (SELECT 1 FROM player_stats WHERE playerID = playerIDVar) THEN
-                -- playerID does not exist, insert it into player_stats table
-                SELECT Player, player_url, Pos, Club, League, Age, Nation INTO @playerNameVar, @playerUrlVar, @playerPosVar, @PlayerClubVar, @PlayerLeagueVar, @PlayerAgeVar, @PlayerNationVar
-                FROM player
-                WHERE playerID = playerIDVar;
-                
-                -- Insert playerID, playerName, and playerURL into player_stats table
-                INSERT INTO player_stats (playerID, Player, player_url, Pos, Club, League, Age, Nation)
-                VALUES (playerIDVar, @playerNameVar, @playerUrlVar, @playerPosVar, @PlayerClubVar, @PlayerLeagueVar, @PlayerAgeVar, @PlayerNationVar);
-            END IF;
-        END;
-        """
-        cursor.execute(player_procedure)
-
-        # Define the trigger codes with placeholders for the column names
-        ins_trigger_code = """
-        CREATE TRIGGER IF NOT EXISTS update_player_stats_onIns AFTER INSERT ON player_game
-        FOR EACH ROW
-        BEGIN
-            CALL insert_player_stats(NEW.playerID);
-
-            UPDATE player_stats
-            SET {sum_cols}
-            WHERE playerID = NEW.playerID;
-
-            UPDATE player_stats
-            SET {avg_cols}
-            WHERE playerID = NEW.playerID;
-        END;
-        """
-
-        # other triggers
-        del_trigger_code = ins_trigger_code.replace(
-            'INSERT', 'DELETE').replace('onIns', 'onDel').replace('NEW', 'OLD')
-        upd_trigger_code = ins_trigger_code.replace(
-            'INSERT', 'UPDATE').replace('onIns', 'onUpd')
-        triggers = [ins_trigger_code, del_trigger_code, upd_trigger_code]
-
-        # Format the column names for summing
-        sum_cols_str = ', '.join(
-            f"{col} = {col} + NEW.{col}" for col in sum_cols)
-
-        # Format the column names for averaging
-        avg_cols_str = ', '.join(f"{col} = (\
-                SELECT AVG({col}) FROM player_game WHERE playerID = NEW.playerID)" for col in avg_cols)
-
-        # Format the trigger codes with the column names
-        for trigger in triggers:
-            trigger_code = trigger.split(' AFTER ')[0].replace(
-                'CREATE TRIGGER', 'DROP TRIGGER IF EXISTS') + ';'
-            if 'AFTER DELETE ON' in trigger:
-                trigger_code = trigger.format(
-                    sum_cols=sum_cols_str.replace('NEW', 'OLD'), avg_cols=avg_cols_str.replace('NEW', 'OLD'))
-            else:
-                trigger_code = trigger.format(
-                    sum_cols=sum_cols_str, avg_cols=avg_cols_str)
-            trigger_code = trigger_code.strip()
-            cursor.execute(trigger_code)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            with timed('db_batch', table='player_stats') as unit:
+                cursor.execute(f"""
+                    INSERT INTO player_stats ({', '.join(quote(col) for col in targets)})
+                    SELECT g.playerID, p.Pos, p.Club, p.League, {', '.join(aggs)}
+                    FROM player_game g
+                    JOIN player p ON p.playerID = g.playerID
+                    WHERE g.playerID IN ({', '.join(['%s'] * len(batch))})
+                    GROUP BY g.playerID, p.Pos, p.Club, p.League
+                    ON DUPLICATE KEY UPDATE {updates}
+                """, batch)
+                unit.count(rows=len(batch))
     conn.commit()
+    print(f'Refreshed player_stats for {len(ids)} players')
 
 
-def create_database(conn, gws, flush=False, players=False):
+def create_database(conn, gws, flush=False, players=False, manifest=None, incremental=False, writers=1):
 
     # delete and recreate database
     if flush:
@@ -375,22 +387,46 @@ def create_database(conn, gws, flush=False, players=False):
             cursor.execute('USE fantasy;')
         conn.commit()
 
+        # nothing is committed to mysql anymore
+        if manifest is not None:
+            manifest.reset('mysql')
+
+    # bring the schema up to date once, before any loading
+    migrate(conn)
+
     if players:
         create_player_table(conn)
 
-    create_player_game_table(conn, gws)
+    create_player_game_table(conn, gws, manifest=manifest, incremental=incremental, writers=writers)
     update_pos(conn)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load fbref player and match data into the fantasy database')
+    parser.add_argument('--incremental', action='store_true',
+                        help='load only matches not yet committed, resuming any unfinished gameweek')
+    parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--flush', action='store_true', help='drop and recreate the database first')
+    parser.add_argument('--players', action='store_true', help='reload the player table')
+    parser.add_argument('--writers', type=int, default=1, help='leagues loaded side by side, each on its own connection')
+    parser.add_argument('--metrics', help='write per-stage metrics here: .prom for Prometheus text, else json lines')
+    args = parser.parse_args()
+
+    gws = {
+        'Premier League': [2],
+        'La Liga': [2], 
+        'Serie A': [1], 
+        'Bundesliga': [1]
+    }
+    if args.incremental:
+        gws = dict.fromkeys(gws)
     create_database(
-        mysqlconnect(), 
-        {
-            'Premier League': [2],
-            'La Liga': [2], 
-            'Serie A': [1], 
-            'Bundesliga': [1]
-        },
-        # flush=True,
-        # players=True
+        mysqlconnect(),
+        {league: gws[league] for league in args.leagues},
+        flush=args.flush,
+        players=args.players,
+        manifest=get_manifest(),
+        incremental=args.incremental,
+        writers=args.writers
     )
+    finish(args.metrics)
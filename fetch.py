@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import CacheMiss, ResponseCache
+from metrics import count, timed
+
+# fbref blocks clients that send more than 10 requests a minute, so that is
+# the budget every scraping function shares. hosts not listed here (e.g. a
+# local test server) are not rate limited.
+HOST_LIMITS = {
+    'fbref.com': (10, 60),
+}
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+
+# serve every page from the on-disk cache and never touch the network
+OFFLINE = os.environ.get('FBREF_OFFLINE', '') not in ('', '0')
+
+
+class TokenBucket:
+    """Per-host token bucket: `rate` requests every `per` seconds, bursting up to `capacity`"""
+
+    def __init__(self, rate, per, capacity=1):
+        self.interval = per / rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # block until a token is available, then take it
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # drain the bucket so nobody else hits the host until the server says so
+        with self.lock:
+            self.tokens = -seconds / self.interval
+            self.updated = time.monotonic()
+
+
+class Fetcher:
+    """Shared HTTP client: pooled connections, per-host rate limits and bounded concurrency"""
+
+    def __init__(self, max_workers=MAX_WORKERS, host_limits=None, max_retries=MAX_RETRIES, timeout=30, cache=None):
+        self.max_workers = max_workers
+        self.cache = cache
+        self.host_limits = HOST_LIMITS if host_limits is None else host_limits
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        # reuse connections across requests, one pool slot per worker
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def bucket(self, url):
+        host = urlsplit(url).hostname or ''
+        if host.startswith('www.'):
+            host = host[4:]
+        if host not in self.host_limits:
+            return None
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(*self.host_limits[host])
+            return self.buckets[host]
+
+    def get(self, url, headers=None):
+        """GET a url, waiting on the host's rate limit and backing off on 429/503"""
+        bucket = self.bucket(url)
+        for attempt in range(self.max_retries + 1):
+            if bucket:
+                bucket.acquire()
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code not in (429, 503) or attempt == self.max_retries:
+                break
+
+            # honour Retry-After if the server sent one, otherwise back off exponentially
+            delay = retry_after(response.headers.get('Retry-After'), default=2 ** attempt * 5)
+            print(f'{response.status_code} from {urlsplit(url).hostname}, retrying in {delay:.0f}s...')
+            count(retries=1)
+            if bucket:
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+        response.raise_for_status()
+
+        # fbref pages are utf-8; don't let requests fall back to latin-1 when the charset is missing
+        if 'charset' not in response.headers.get('Content-Type', ''):
+            response.encoding = 'utf-8'
+        return response
+
+    def fetch(self, url):
+        """Return the decoded body of a url, going through the cache if there is one"""
+        with timed('fetch', host=urlsplit(url).hostname or '', url=url) as unit:
+            html = self.read(url)
+            unit.count(bytes=len(html))
+            return html
+
+    def read(self, url):
+        if self.cache is None:
+            return self.get(url).text
+
+        cached = self.cache.lookup(url)
+        if cached and (cached[1] or self.cache.offline):
+            count(cache_hits=1)
+            return cached[0]
+        if self.cache.offline:
+            raise CacheMiss(url)
+
+        # revalidate stale entries instead of downloading them again
+        response = self.get(url, headers=cached[2] if cached else None)
+        if response.status_code == 304 and cached:
+            count(cache_revalidated=1)
+            self.cache.touch(url)
+            return cached[0]
+        count(cache_misses=1)
+        self.cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response.text
+
+    def fetch_many(self, urls):
+        """Fetch urls concurrently, returning bodies in the same order as urls"""
+        return list(self.executor.map(self.fetch, urls))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def retry_after(value, default):
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher(cache=ResponseCache(offline=OFFLINE))
+    return _fetcher
+
+
+def configure(offline=OFFLINE, **kwargs):
+    """Replace the shared fetcher, e.g. configure(host_limits={}) against a local server
+
+    The shared fetcher caches to data/cache unless cache=None is passed.
+    """
+    global _fetcher
+    if _fetcher is not None:
+        _fetcher.close()
+    if 'cache' not in kwargs:
+        kwargs['cache'] = ResponseCache(offline=offline)
+    _fetcher = Fetcher(**kwargs)
+    return _fetcher
+
+
+def fetch(url):
+    return get_fetcher().fetch(url)
+
+
+def fetch_many(urls):
+    return get_fetcher().fetch_many(urls)
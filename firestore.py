@@ -1,102 +1,181 @@
+import argparse
 import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 import firebase_admin
+import pandas as pd
 from firebase_admin import firestore
 from google.api_core.exceptions import RetryError
 from google.api_core.retry import Retry
+from google.auth.credentials import AnonymousCredentials
 
-from scraping import get_matches, get_player_data, get_player_match_data, get_player_pos
+from ingest import ingest_matches, ingest_players
+from leagues import URLS
+from manifest import get_manifest
+from metrics import count, finish, timed
+from positions import get_position_store
+from scraping import get_player_positions
+from sinks import FirestoreSink
 
 retry = Retry(deadline=120.0)
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/Users/max/fantasySoccer/credentials.json"
-
-# cred = credentials.Certificate("credentials.json")
-firebase_admin.initialize_app()
-db = firestore.client()
-
-HOME_URL = 'https://fbref.com/'
-URLS = {
-    'Premier League': {
-        'matches': 'https://fbref.com/en/comps/9/schedule/Premier-League-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/9/Premier-League-Stats'
-    },
-    'La Liga': {
-        'matches': 'https://fbref.com/en/comps/12/schedule/La-Liga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/12/La-Liga-Stats'
-    },
-    'Serie A': {
-        'matches': 'https://fbref.com/en/comps/11/schedule/Serie-A-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/11/Serie-A-Stats'
-    },
-    'Bundesliga': {
-        'matches': 'https://fbref.com/en/comps/20/schedule/Bundesliga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/20/Bundesliga-Stats'}
-}
+# firestore caps a batched write at 500 operations
+BATCH_SIZE = 500
+MAX_IN_FLIGHT = 8
+
+if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+    # the local emulator (gcloud emulators firestore start) takes any project and no credentials
+    db = firestore.Client(project=os.environ.get('GCLOUD_PROJECT', 'fantasy-soccer'), credentials=AnonymousCredentials())
+else:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/Users/max/fantasySoccer/credentials.json"
+
+    # cred = credentials.Certificate("credentials.json")
+    firebase_admin.initialize_app()
+    db = firestore.client()
+
 
 def api_call(api_function, *args, max_retries=3, retry_delay=5, **kwargs):
-    for _ in range(max_retries + 1):
+    with timed('api_call', sink='firestore', call=getattr(api_function, '__qualname__', str(api_function))):
+        for _ in range(max_retries + 1):
+            try:
+                # Call the API function with potential params
+                result = api_function(*args, **kwargs)
+                return result
+            except RetryError as e:
+                print(f"RetryError: {e}")
+                print(f"Retrying in {retry_delay} seconds...")
+                count(retries=1)
+                time.sleep(retry_delay)
+
+        # If all retries fail, you might want to raise an exception or handle it accordingly
+        raise Exception("API request failed after multiple retries")
+
+
+def write_documents(writes, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, label='documents'):
+    """Merge-set (document ref, data) pairs in batched writes, several batches in flight at once
+
+    Merge-sets create missing documents and only overwrite the given fields
+    of existing ones, so nothing has to be read first. Failed batches are
+    retried by api_call, then counted rather than stopping the load. Prints
+    and returns the number of documents written and failed and the
+    throughput.
+    """
+    def chunks():
+        it = iter(writes)
+        while chunk := list(islice(it, batch_size)):
+            yield chunk
+
+    def commit(chunk):
+        batch = db.batch()
+        for ref, data in chunk:
+            batch.set(ref, data, merge=True)
         try:
-            # Call the API function with potential params
-            result = api_function(*args, **kwargs)
-            return result
-        except RetryError as e:
-            print(f"RetryError: {e}")
-            print(f"Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-
-    # If all retries fail, you might want to raise an exception or handle it accordingly
-    raise Exception("API request failed after multiple retries")
-
-
-def insert_players_data():
-    for league in URLS:
-        players_data = get_player_data(league)
-        # add league if doesn't exist
-        if not db.collection('leagues').document(league).get().exists:
-            api_call(db.collection('leagues').document(league).set, {})
-
-        # add each club that dosnt't exist
-        clubs = players_data['club'].unique().tolist()
-        for club in clubs:
-            club_ref = db.collection('leagues').document(league).collection('clubs').document(club)
-            if not api_call(club_ref.get).exists:
-                api_call(club_ref.set, {})
-        players_data.apply(lambda player: api_call(db.collection('leagues').document(league).collection('clubs').document(player['club']).collection('players').document(player['ID']).set, {key: value for key, value in player.items() if key not in ['ID', 'club', 'league']}), axis=1)
-        print(f'{league} players data inserted')
-
-
-def insert_matches_data(gw_map):
-    for league in gw_map:
-        for gw in gw_map[league]:
-            matches_data  = get_matches(URLS[league]['matches'], gw)
-            player_matches_data = get_player_match_data(league, gw)
-
-            # add gw if doesn't exist    
-            gw_ref = db.collection('leagues').document(league).collection('matches').document(str(gw))
-            if not api_call(gw_ref.get).exists:
-                api_call(gw_ref.set, {})
-
-            # insert matches
-            matches_data.apply(lambda match: api_call(gw_ref.set, {match['id']: {key: value for key, value in match.items() if key not in ['playerid', 'matchid', 'club', 'gw']}}), axis=1)
-   
-            # insert player matches
-            player_matches_data.apply(
-                lambda player: 
-                    api_call(db.collection('leagues').document(league).collection('clubs').document(player['club']).collection('players').document(player['playerid']).collection('games').document(player['matchid']).set, {key: value for key, value in player.items() if key not in ['playerid', 'matchid' 'club', 'league']}), axis=1)
-            print(f'{league} matches data inserted')
+            with timed('firestore_batch', sink='firestore', label=label) as unit:
+                unit.count(rows=len(chunk))
+                api_call(batch.commit)
+            return len(chunk), None
+        except Exception as e:
+            return len(chunk), e
+
+    stats = {'written': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for size, error in executor.map(commit, chunks()):
+            stats['batches'] += 1
+            if error is None:
+                stats['written'] += size
+            else:
+                stats['failed'] += size
+                stats['errors'].append(error)
+    stats['seconds'] = time.perf_counter() - start
+    stats['per_second'] = stats['written'] / stats['seconds'] if stats['seconds'] else 0.0
+
+    print(f'{label}: {stats["written"]} written, {stats["failed"]} failed in {stats["batches"]} batches '
+          f'({stats["seconds"]:.1f}s, {stats["per_second"]:.0f}/s)')
+    for error in stats['errors'][:3]:
+        print(f'    {type(error).__name__}: {error}')
+    return stats
+
+
+def write_players(league, players_data):
+    """Merge one league's players into their club documents, returning the write stats"""
+    league_ref = db.collection('leagues').document(league)
+
+    # the league and each club are merged in alongside their players, so there's no need to check they exist
+    writes = [(league_ref, {})]
+    writes += [(league_ref.collection('clubs').document(club), {}) for club in players_data['club'].unique()]
+    writes += [(league_ref.collection('clubs').document(player['club']).collection('players').document(player['ID']),
+                {key: value for key, value in player.items() if key not in ['ID', 'club', 'league']})
+               for player in players_data.to_dict('records')]
+    stats = write_documents(writes, label=f'{league} players')
+    print(f'{league} players data inserted')
+    return stats
+
+
+def insert_players_data(leagues=None):
+    ingest_players(leagues or list(URLS), [FirestoreSink(client=sys.modules[__name__])])
+
+
+def write_match(league, gw, match_id, player_matches_data, fixture):
+    """Write one match's fixture into its gameweek document and its player games, returning the write stats"""
+    league_ref = db.collection('leagues').document(league)
+
+    # fixtures are merged into the gameweek document, so matches can land in any order
+    gw_ref = league_ref.collection('matches').document(str(gw))
+    writes = [(gw_ref, {match_id: {key: value for key, value in fixture.items() if key not in ['playerid', 'matchid', 'club', 'gw']}})]
+
+    # player matches
+    writes += [(league_ref.collection('clubs').document(player['club']).collection('players').document(player['playerid'])
+                .collection('games').document(player['matchid']),
+                {key: value for key, value in player.items() if key not in ['playerid', 'matchid', 'club', 'league']})
+               for player in player_matches_data.to_dict('records')]
+    return write_documents(writes, label=f'{league} GW {gw} {match_id}')
+
+
+def insert_matches_data(gw_map, max_workers=MAX_IN_FLIGHT, manifest=None, incremental=False):
+    # every league streams side by side through ingest, firestore being the only sink
+    sink = FirestoreSink(client=sys.modules[__name__])
+    failed = ingest_matches(gw_map, [sink], manifest=manifest, incremental=incremental, max_leagues=max_workers)
+    if failed:
+        print(f'{failed} matches failed to load; rerun with --incremental to retry them')
 
 
 def update_player_pos():
-    players = db.collection('players').get()
-    for player in players:
-        player_data = player.to_dict()
-        player_pos = get_player_pos(player_data['player_url'])
-        api_call(db.collection('leagues').document(player_data['league']).collection('clubs').document(player_data['club']).collection('players').document(player_data['id']).update, {'pos': player_pos})
-        print(f'{player_data["name"]} position updated')
+    """Bring the position on every player document in line with the position store
+
+    Player documents live under leagues/{league}/clubs/{club}/players, so
+    they're read with one collection group query. Only players missing from
+    the store or past its refresh age are scraped, and only documents whose
+    position changed are written.
+    """
+    docs = [doc for doc in api_call(db.collection_group('players').get) if doc.reference.path.startswith('leagues/')]
+    players = pd.DataFrame([{**doc.to_dict(), 'playerID': doc.id, 'ref': doc.reference} for doc in docs])
+    if players.empty:
+        return
+
+    positions = get_position_store().lookup(players[['playerID', 'player_url']], get_player_positions)
+    positions = positions.str.split(',').str[0]
+    current = players['position'] if 'position' in players else pd.Series(None, index=players.index)
+    changed = players[positions.notna() & (positions != current)].assign(position=positions)
+    write_documents([(player['ref'], {'position': player['position']}) for player in changed.to_dict('records')],
+                    label='player positions')
+
 
 if __name__ == '__main__':
-    insert_players_data()
-    insert_matches_data({'Premier League': [x for x in range(1, 13)], 'La Liga': [x for x in range(1, 13)], 'Serie A': [x for x in range(1, 13)], 'Bundesliga': [x for x in range(1, 13)]})
-    update_player_pos()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Load fbref player and match data into Firestore')
+    parser.add_argument('--incremental', action='store_true',
+                        help='load only matches not yet committed, resuming any unfinished gameweek')
+    parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--skip-players', action='store_true', help="don't reload player documents")
+    parser.add_argument('--metrics', help='write per-stage metrics here: .prom for Prometheus text, else json lines')
+    args = parser.parse_args()
+
+    if not args.skip_players:
+        insert_players_data(args.leagues)
+    gws = None if args.incremental else [x for x in range(1, 13)]
+    insert_matches_data({league: gws for league in args.leagues}, manifest=get_manifest(), incremental=args.incremental)
+    update_player_pos()
+    finish(args.metrics)
@@ -0,0 +1,154 @@
+"""Scrape fbref once and fan every batch out to any number of sinks
+
+    python ingest.py --sinks mysql firestore [--leagues ...] [--gws 1 2 3] [--players]
+    python ingest.py --sinks mysql parquet --incremental
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from leagues import URLS
+from manifest import get_manifest
+from metrics import finish, timed
+from schema import widen
+from scraping import get_player_data, get_schedule, iter_player_match_rows
+from sinks import SINKS
+
+# leagues scraped side by side; they still share the fetcher's rate limit
+MAX_LEAGUES = 4
+
+
+def gameweeks(schedule, gws):
+    """Normalize a gameweek spec: None for every played gameweek, n in a list for 1..n, or a list"""
+    if gws is None:
+        return list(schedule.gameweeks)
+    if type(gws) in (str, int):
+        return [int(gws)]
+    if len(gws) == 1:
+        return list(range(1, gws[0] + 1))
+    return list(gws)
+
+
+def fan_out(executor, sinks, call):
+    """Run call(sink) for every sink at once, returning {sink: exception} for those that failed"""
+    if len(sinks) == 1:
+        try:
+            call(sinks[0])
+            return {}
+        except Exception as e:
+            return {sinks[0]: e}
+
+    futures = {sink: executor.submit(call, sink) for sink in sinks}
+    return {sink: future.exception() for sink, future in futures.items() if future.exception() is not None}
+
+
+def write(sink, league, frame, gw=None, match_id=None):
+    """One sink write, timed under the sink's name"""
+    if match_id is None:
+        with timed('sink_players', league=league, sink=sink.name) as unit:
+            sink.write_players(league, frame)
+    else:
+        with timed('sink_write', league=league, sink=sink.name, gw=gw, match=match_id) as unit:
+            sink.write(league, gw, match_id, frame)
+    unit.count(rows=len(frame))
+
+
+def report(errors, what):
+    for sink, e in errors.items():
+        print(f'{sink.name} failed on {what}: {type(e).__name__}: {e}')
+
+
+def ingest_players(leagues, sinks):
+    """Scrape each league's players once and hand the frame to every sink"""
+    failed = 0
+    with ThreadPoolExecutor(max_workers=len(sinks)) as executor:
+        for league in leagues:
+            # frames are held compact, but sinks get float64 so none of them store float32 noise
+            players = widen(get_player_data(league))
+            errors = fan_out(executor, sinks, lambda sink: write(sink, league, players))
+            report(errors, f'{league} players')
+            failed += len(errors)
+    return failed
+
+
+def ingest_league(league, gws, sinks, executor, manifest=None, incremental=False):
+    schedule = get_schedule(URLS[league]['matches'])
+    gws = gameweeks(schedule, gws)
+
+    # in incremental mode only matches some sink hasn't committed are scraped, and only those sinks get them
+    if incremental:
+        pending = {}
+        for sink in sinks:
+            for gw, match_ids in manifest.pending(league, schedule, sink.name, gws).items():
+                pending.setdefault(gw, set()).update(match_ids)
+        units = {gw: [match_id for match_id in schedule.gameweek(gw)['ID'] if match_id in pending[gw]]
+                 for gw in sorted(pending)}
+        print(f'{league}: {sum(map(len, units.values()))} matches to load in {len(units)} gameweeks')
+    else:
+        units = dict.fromkeys(gws)
+
+    # the whole league is one unit, so the parses and frames inside it are attributed to it
+    failed = 0
+    with timed('league', league=league):
+        for gw, match_id, frame in iter_player_match_rows(league, units, schedule=schedule, manifest=manifest):
+            targets = sinks
+            if incremental:
+                targets = [sink for sink in sinks if match_id not in manifest.done(league, gw, 'committed', sink.name)]
+
+            frame = widen(frame)
+            errors = fan_out(executor, targets, lambda sink: write(sink, league, frame, gw, match_id))
+            if manifest is not None:
+                for sink in targets:
+                    if sink not in errors:
+                        manifest.mark(league, gw, [match_id], 'committed', sink.name)
+            report(errors, f'{league} GW {gw} match {match_id}')
+            failed += len(errors)
+
+    if units:
+        with timed('sink_finish', league=league):
+            errors = fan_out(executor, sinks, lambda sink: sink.finish(league))
+        report(errors, f'finishing {league}')
+        failed += len(errors)
+        if manifest is not None:
+            manifest.bump()
+    return failed
+
+
+def ingest_matches(gw_map, sinks, manifest=None, incremental=False, max_leagues=MAX_LEAGUES):
+    """Scrape {league: gameweeks} once, match by match, writing each batch to every sink
+
+    Leagues stream side by side and each batch goes to all sinks at once.
+    A sink failing on a batch doesn't stop the others, and it isn't
+    recorded as committed, so an incremental rerun retries just that sink.
+    Returns the number of failed sink writes.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(sinks))) as executor, \
+            ThreadPoolExecutor(max_workers=max_leagues) as leagues:
+        futures = [leagues.submit(ingest_league, league, gws, sinks, executor, manifest, incremental)
+                   for league, gws in gw_map.items()]
+        return sum(future.result() for future in futures)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sinks', nargs='+', choices=list(SINKS), default=['stdout'])
+    parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--gws', nargs='+', type=int, help='gameweeks to load, or one number n for 1..n; default every played gameweek')
+    parser.add_argument('--incremental', action='store_true',
+                        help='load only matches some sink has not committed, resuming any unfinished gameweek')
+    parser.add_argument('--players', action='store_true', help='load player data first')
+    parser.add_argument('--metrics', help='write per-stage metrics here: .prom for Prometheus text, else json lines')
+    args = parser.parse_args()
+
+    sinks = [SINKS[name]() for name in args.sinks]
+    try:
+        failed = 0
+        if args.players:
+            failed += ingest_players(args.leagues, sinks)
+        failed += ingest_matches({league: args.gws for league in args.leagues}, sinks,
+                                 manifest=get_manifest(), incremental=args.incremental)
+    finally:
+        for sink in sinks:
+            sink.close()
+    finish(args.metrics)
+    if failed:
+        raise SystemExit(f'{failed} sink writes failed')
@@ -0,0 +1,19 @@
+# every league the pipeline scrapes: its fixtures page and its squad stats page.
+# adding one here is all it takes for scraping and the loaders; League columns are plain strings
+URLS = {
+    'Premier League': {
+        'matches': 'https://fbref.com/en/comps/9/schedule/Premier-League-Scores-and-Fixtures',
+        'players': 'https://fbref.com/en/comps/9/Premier-League-Stats'
+    },
+    'La Liga': {
+        'matches': 'https://fbref.com/en/comps/12/schedule/La-Liga-Scores-and-Fixtures',
+        'players': 'https://fbref.com/en/comps/12/La-Liga-Stats'
+    },
+    'Serie A': {
+        'matches': 'https://fbref.com/en/comps/11/schedule/Serie-A-Scores-and-Fixtures',
+        'players': 'https://fbref.com/en/comps/11/Serie-A-Stats'
+    },
+    'Bundesliga': {
+        'matches': 'https://fbref.com/en/comps/20/schedule/Bundesliga-Scores-and-Fixtures',
+        'players': 'https://fbref.com/en/comps/20/Bundesliga-Stats'}
+}
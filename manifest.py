@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_PATH = 'data/manifest.db'
+
+# a match is fetched and parsed once, then committed separately to each sink
+STAGES = ['fetched', 'parsed', 'committed']
+
+
+class Manifest:
+    """Checkpoints of which (league, gameweek, match) units got through each stage
+
+    Fetching and parsing are recorded with an empty sink; commits are
+    recorded per sink ('mysql', 'firestore', ...), so one sink failing
+    doesn't make the others redo their work.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS units (
+                league TEXT NOT NULL,
+                gw INTEGER NOT NULL,
+                match_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                sink TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (league, gw, match_id, stage, sink)
+            )
+        """)
+
+        # bumped whenever a sink's data changes, so readers (api.py) know when to drop cached responses
+        self.conn.execute('CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)')
+        self.conn.execute('INSERT OR IGNORE INTO generation VALUES (0, 0)')
+        self.conn.commit()
+
+    def mark(self, league, gw, match_ids, stage, sink=''):
+        """Record that these matches of a gameweek finished a stage"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?)',
+                [(league, int(gw), match_id, stage, sink, now) for match_id in match_ids])
+            if stage == 'committed':
+                self.conn.execute('UPDATE generation SET value = value + 1')
+            self.conn.commit()
+
+    def done(self, league, gw, stage, sink=''):
+        """Match ids of a gameweek that finished a stage"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT match_id FROM units WHERE league = ? AND gw = ? AND stage = ? AND sink = ?',
+                (league, int(gw), stage, sink)).fetchall()
+        return {match_id for match_id, in rows}
+
+    def pending(self, league, schedule, sink, gws=None):
+        """{gw: [match ids]} of played matches not yet committed to a sink
+
+        Only gameweeks in gws are considered, or every gameweek on the
+        schedule if gws is None.
+        """
+        gws = schedule.gameweeks if gws is None else gws
+        units = {}
+        for gw in gws:
+            committed = self.done(league, gw, 'committed', sink)
+            match_ids = [match_id for match_id in schedule.gameweek(gw)['ID'] if match_id not in committed]
+            if match_ids:
+                units[gw] = match_ids
+        return units
+
+    def reset(self, sink):
+        """Forget every commit to a sink, e.g. after it was wiped"""
+        with self.lock:
+            self.conn.execute("DELETE FROM units WHERE stage = 'committed' AND sink = ?", (sink,))
+            self.conn.execute('UPDATE generation SET value = value + 1')
+            self.conn.commit()
+
+    def bump(self):
+        """Tell readers the sinks' data changed without a commit, e.g. after refreshing aggregates"""
+        with self.lock:
+            self.conn.execute('UPDATE generation SET value = value + 1')
+            self.conn.commit()
+
+    def generation(self):
+        """A counter that goes up every time committed data changes"""
+        with self.lock:
+            return self.conn.execute('SELECT value FROM generation').fetchone()[0]
+
+    def summary(self):
+        """Units per league, stage and sink"""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT league, stage, sink, COUNT(*), MAX(gw) FROM units '
+                'GROUP BY league, stage, sink ORDER BY league, stage, sink').fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+_manifest = None
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        _manifest = Manifest()
+    return _manifest
+
+
+if __name__ == '__main__':
+    for league, stage, sink, count, last_gw in get_manifest().summary():
+        print(f'{league:<16} {stage:<10} {sink or "-":<10} {count:>5} matches (up to GW {last_gw})')
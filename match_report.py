@@ -0,0 +1,197 @@
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from lxml import html as lxml_html
+
+HOME_URL = 'https://fbref.com/'
+
+# player stats tables on a match report, in the order they're folded together
+TABLE_KINDS = ['summary', 'passing', 'passing_types', 'defense', 'possession', 'misc', 'keeper']
+TABLE_ID = re.compile(r'^(?:stats_([0-9a-f]{8})_(summary|passing|passing_types|defense|possession|misc)'
+                      r'|keeper_stats_([0-9a-f]{8}))$')
+
+# columns every table repeats for a player; anything else is only kept from
+# the first table that has it, so the keeper table's launched-pass Cmp/Att
+# don't collide with the passing totals
+IDENTITY_COLS = ['playerID', 'Player', '#', 'Nation', 'Pos', 'Age', 'Min', 'Club', 'player_url']
+TEXT_COLS = {'playerID', 'Player', 'Nation', 'Pos', 'Club', 'player_url'}
+
+
+@dataclass
+class StatTable:
+    """One stats table for one team, as column arrays with a row per player"""
+    team: str
+    kind: str
+    columns: dict = field(default_factory=dict)
+
+    def frame(self):
+        return pd.DataFrame(self.columns)
+
+
+@dataclass
+class MatchReport:
+    match_id: str
+    teams: list
+    tables: list
+
+    def frames(self):
+        """Per-table dataframes in home-then-away, TABLE_KINDS order"""
+        return [table.frame() for table in self.tables]
+
+
+def text(el):
+    # collapse the non-breaking spaces fbref uses to indent substitutes
+    return ' '.join(el.text_content().split())
+
+
+def to_array(values, name):
+    """Convert a column of cell strings to a typed array"""
+    if name in TEXT_COLS:
+        return np.array(values, dtype=object)
+    try:
+        return np.array([float(v.replace(',', '')) if v else np.nan for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=object)
+
+
+def parse_table(table):
+    """Read a stats table into {column: [cell strings]}, one entry per linked player"""
+    header = [text(th) for th in table.xpath('./thead/tr[last()]/th')]
+
+    # keep the first of any repeated column names, like the totals/short/long Cmp
+    keep = []
+    seen = set()
+    for i, name in enumerate(header):
+        if name not in seen:
+            seen.add(name)
+            keep.append((i, name))
+
+    rows = {'playerID': [], 'player_url': []}
+    rows.update({name: [] for _, name in keep})
+    for tr in table.xpath('./tbody/tr[not(contains(@class, "thead"))]'):
+        cells = tr.xpath('./th|./td')
+        link = cells[0].xpath('.//a/@href') if cells else []
+        if not link:
+            continue
+        values = {name: text(cells[i]) if i < len(cells) else '' for i, name in keep}
+
+        # the same rows clean_columns drops: no nation or no age
+        if values.get('Nation') == '' or values.get('Age') == '':
+            continue
+        if 'Nation' in values:
+            values['Nation'] = values['Nation'].split(' ')[-1]
+        if 'Age' in values:
+            values['Age'] = values['Age'].split('-')[0]
+
+        rows['playerID'].append(link[0].split('/')[-2])
+        rows['player_url'].append(HOME_URL[:-1] + link[0])
+        for name, value in values.items():
+            rows[name].append(value)
+    return rows
+
+
+def parse_match_report(html, url=None):
+    """Parse a match report page in one pass using the stats table ids
+
+    Returns a MatchReport holding the team names, the match id and a
+    StatTable per team and table kind, with each player's stats as typed
+    arrays.
+    """
+    tree = lxml_html.fromstring(html)
+
+    if url is None:
+        url = tree.xpath('string(//link[@rel="canonical"]/@href)')
+    match_id = url.rstrip('/').split('/')[-2]
+
+    # home then away, keyed by squad id so tables are attributed by id, not position
+    squads = {}
+    for a in tree.xpath('//div[contains(@class, "scorebox")]//strong/a[contains(@href, "/en/squads/")]'):
+        squads.setdefault(a.get('href').split('/')[3], a.text)
+    teams = list(squads.values())
+
+    parsed = {}
+    for table in tree.xpath('//table[starts-with(@id, "stats_") or starts-with(@id, "keeper_stats_")]'):
+        m = TABLE_ID.match(table.get('id'))
+        if m is None:
+            continue
+        squad = m.group(1) or m.group(3)
+        kind = m.group(2) or 'keeper'
+        parsed[squad, kind] = parse_table(table)
+
+    tables = []
+    for squad, team in squads.items():
+        seen = set()
+        for kind in TABLE_KINDS:
+            if (squad, kind) not in parsed:
+                continue
+            rows = parsed[squad, kind]
+            rows['Club'] = [team] * len(rows['playerID'])
+
+            # identity columns first and last, like clean_columns leaves them, then new stats
+            names = ['playerID', 'Player'] + [
+                name for name in rows if name not in ('playerID', 'Player', 'Club', 'player_url')
+                and (name in IDENTITY_COLS or name not in seen)] + ['Club', 'player_url']
+            seen.update(names)
+            tables.append(StatTable(team, kind, {name: to_array(rows[name], name) for name in names}))
+
+    return MatchReport(match_id, teams, tables)
+
+
+def assemble(reports):
+    """Join every report's stats tables into one frame, one row per player per match
+
+    Each table kind's blocks are concatenated across matches first, then the
+    kinds are joined once on (matchID, playerID), so nothing is re-merged
+    per table or re-concatenated per match. Rows come out in match order,
+    sorted by Player, playerID and Club within a match, with columns in the
+    order they first appear.
+    """
+    blocks = {}
+    names = {}
+    order = {}
+    for report in reports:
+        order.setdefault(report.match_id, len(order))
+        for table in report.tables:
+            columns = dict(table.columns)
+            columns['matchID'] = np.full(len(columns['playerID']), report.match_id, dtype=object)
+            blocks.setdefault(table.kind, []).append(columns)
+            names.update(dict.fromkeys(table.columns))
+
+    kinds = [kind for kind in TABLE_KINDS if kind in blocks]
+    if not kinds:
+        return pd.DataFrame(columns=['Player', 'playerID', 'Club', 'matchID'])
+
+    def column(kind, name):
+        # one column of a table kind across every match, NaN where a block lacks it
+        return np.concatenate([block[name] if name in block else np.full(len(block['playerID']), np.nan)
+                               for block in blocks[kind]])
+
+    # identity columns repeat in every table, so take each one's first value
+    # and settle the row order on that narrow frame
+    identity = [name for name in IDENTITY_COLS if name in names and name != 'playerID']
+    first = pd.concat([pd.DataFrame({name: column(kind, name) for name in ['matchID', 'playerID'] + identity
+                                     if any(name in block for block in blocks[kind])}) for kind in kinds])
+    first = first.groupby(['matchID', 'playerID'], sort=False).first().reset_index()
+    first['match_order'] = first['matchID'].map(order)
+    first = first.sort_values(['match_order', 'Player', 'playerID', 'Club'], kind='mergesort', ignore_index=True)
+    keys = pd.MultiIndex.from_frame(first[['matchID', 'playerID']])
+
+    # every other stat comes from exactly one table; gather it straight into place
+    columns = {name: first[name].to_numpy() for name in ['playerID', 'matchID'] + identity}
+    for kind in kinds:
+        indexer = pd.MultiIndex.from_arrays([column(kind, 'matchID'), column(kind, 'playerID')]).get_indexer(keys)
+        missing = indexer == -1
+        for name in dict.fromkeys(name for block in blocks[kind] for name in block):
+            if name in columns:
+                continue
+            values = column(kind, name).take(indexer)
+            if missing.any():
+                values = values.astype(np.float64 if values.dtype.kind in 'fiu' else object)
+                values[missing] = np.nan
+            columns[name] = values
+
+    cols = ['Player', 'playerID', 'Club'] + [
+        name for name in names if name not in ('Player', 'playerID', 'Club')] + ['matchID']
+    return pd.DataFrame({name: columns[name] for name in cols})
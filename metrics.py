@@ -0,0 +1,193 @@
+"""Per-unit timings and counters for ingestion runs
+
+Wrap a unit of work in timed() to record how long it took, with labels
+saying what it was (league, gw, match, sink, table...) and counts of what it
+did (bytes, rows, retries, cache hits):
+
+    with timed('parse', league=league, match=match_id) as unit:
+        ...
+        unit.count(rows=len(df))
+
+count() outside a unit adds to the innermost unit open on the calling
+thread, so lower layers (fetch retries, api_call) can report into whatever
+is being timed without being passed it. export() writes the run as a
+Prometheus text file (.prom) or JSON lines, and summary() prints where the
+time went.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# labels metrics are aggregated by in the Prometheus export; the rest (url, match...) stay in the json lines
+AGGREGATE_LABELS = ['league', 'sink', 'table', 'host']
+
+
+class Unit:
+    """One timed piece of work"""
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.counts = {}
+        self.seconds = 0.0
+        self.started = time.time()
+
+    def count(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def record(self):
+        return {'stage': self.stage, 'seconds': round(self.seconds, 6), 'started': round(self.started, 3),
+                **self.labels, **self.counts}
+
+
+class Metrics:
+    """Thread-safe store of the units a run has finished"""
+
+    def __init__(self):
+        self.units = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def open_units(self):
+        if not hasattr(self.local, 'units'):
+            self.local.units = []
+        return self.local.units
+
+    def inherit(self, labels):
+        # nested units take their parent's league, sink... so a db batch is attributed to the sink write it's part of
+        stack = self.open_units()
+        if not stack:
+            return labels
+        return {**{label: stack[-1].labels[label] for label in AGGREGATE_LABELS if label in stack[-1].labels}, **labels}
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        stack = self.open_units()
+        unit = Unit(stage, self.inherit(labels))
+        stack.append(unit)
+        start = time.perf_counter()
+        try:
+            yield unit
+        except Exception as e:
+            unit.labels['error'] = type(e).__name__
+            raise
+        finally:
+            unit.seconds = time.perf_counter() - start
+            stack.pop()
+            with self.lock:
+                self.units.append(unit)
+
+    def count(self, **counts):
+        """Add counts to the innermost unit open on this thread; dropped if there is none"""
+        stack = self.open_units()
+        if stack:
+            stack[-1].count(**counts)
+
+    def add(self, stage, seconds, **labels):
+        """Record a unit timed elsewhere, e.g. in a worker process"""
+        unit = Unit(stage, self.inherit(labels))
+        unit.seconds = seconds
+        with self.lock:
+            self.units.append(unit)
+        return unit
+
+    def records(self):
+        with self.lock:
+            return [unit.record() for unit in self.units]
+
+    def totals(self, by=('stage',)):
+        """{label values: {'units', 'seconds', counts...}} summed over the units sharing the labels in by"""
+        with self.lock:
+            units = list(self.units)
+        totals = defaultdict(lambda: defaultdict(float))
+        for unit in units:
+            labels = {'stage': unit.stage, **unit.labels}
+            total = totals[tuple(labels.get(label) for label in by)]
+            total['units'] += 1
+            total['seconds'] += unit.seconds
+            for name, value in unit.counts.items():
+                total[name] += value
+        return totals
+
+    def prometheus(self, prefix='fantasy'):
+        """The run as Prometheus text exposition, one series per stage and aggregate label set"""
+        by = ['stage'] + AGGREGATE_LABELS
+        totals = self.totals(by)
+        counters = sorted({name for total in totals.values() for name in total} - {'units', 'seconds'})
+        lines = [f'# HELP {prefix}_stage_seconds Time spent in each ingest stage',
+                 f'# TYPE {prefix}_stage_seconds summary']
+        series = []
+        for key, total in sorted(totals.items(), key=lambda item: [str(v) for v in item[0]]):
+            labels = ','.join(f'{label}="{escape(value)}"' for label, value in zip(by, key) if value is not None)
+            series.append((labels, total))
+            lines.append(f'{prefix}_stage_seconds_sum{{{labels}}} {total["seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{{labels}}} {int(total["units"])}')
+        for name in counters:
+            lines += [f'# HELP {prefix}_{name}_total {name} counted by each ingest stage',
+                      f'# TYPE {prefix}_{name}_total counter']
+            lines += [f'{prefix}_{name}_total{{{labels}}} {total[name]:g}' for labels, total in series if name in total]
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """Write the run to path: Prometheus text for .prom files, otherwise one json object per unit"""
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.prometheus())
+            else:
+                for record in self.records():
+                    f.write(json.dumps(record, default=str) + '\n')
+
+    def summary(self, top=10):
+        """Print time per stage, league and sink, then the slowest units"""
+        records = self.records()
+        if not records:
+            return
+        print(f'{"stage":<18} {"league":<16} {"sink":<10} {"units":>6} {"seconds":>9} {"max s":>7}')
+        slowest = defaultdict(float)
+        for record in records:
+            key = (record['stage'], record.get('league'), record.get('sink'))
+            slowest[key] = max(slowest[key], record['seconds'])
+        totals = self.totals(('stage', 'league', 'sink'))
+        for key, total in sorted(totals.items(), key=lambda item: -item[1]['seconds']):
+            stage, league, sink = key
+            print(f'{stage:<18} {league or "-":<16} {sink or "-":<10} {int(total["units"]):>6} '
+                  f'{total["seconds"]:>9.2f} {slowest[key]:>7.2f}')
+
+        print(f'\nslowest {min(top, len(records))} units')
+        for record in sorted(records, key=lambda record: -record['seconds'])[:top]:
+            details = ' '.join(f'{name}={value}' for name, value in record.items() if name not in ('stage', 'seconds', 'started'))
+            print(f'{record["seconds"]:>8.2f}s {record["stage"]:<18} {details}')
+
+    def reset(self):
+        with self.lock:
+            self.units = []
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def timed(stage, **labels):
+    return _metrics.timed(stage, **labels)
+
+
+def count(**counts):
+    _metrics.count(**counts)
+
+
+def finish(path=None, top=10):
+    """End-of-run report: print the summary and export to path if one is given"""
+    _metrics.summary(top)
+    if path:
+        _metrics.export(path)
+        print(f'Metrics written to {path}')
@@ -0,0 +1,266 @@
+from schema import FLOAT_COLS, INT_COLS
+
+# a plain string, not an ENUM of leagues.URLS: released migrations would freeze the ENUM
+# at whichever leagues existed then, and every new league would need its own ALTER
+LEAGUE = 'VARCHAR(32)'
+ID = 'CHAR(8) NOT NULL'
+
+# per-match stats as named in player_game; the rest of schema.INT_COLS are identity or season columns
+GAME_STATS = [col for col in INT_COLS if col not in ['gw', 'age', 'matches', 'mp', 'starts', 'mins', 'min', 'num']]
+GAME_STATS += FLOAT_COLS
+
+# every table's exact columns, keys and secondary indexes
+TABLES = {
+    'player': {
+        'columns': [
+            ('playerID', ID), ('player_url', 'VARCHAR(255)'), ('Player', 'VARCHAR(128)'), ('Pos', 'VARCHAR(32)'),
+            ('Club', 'VARCHAR(64)'), ('League', LEAGUE), ('Nation', 'CHAR(3)'), ('Age', 'TINYINT UNSIGNED'),
+            ('MP', 'SMALLINT DEFAULT 0'), ('Starts', 'SMALLINT DEFAULT 0'), ('Min', 'SMALLINT DEFAULT 0'),
+        ],
+        'primary': ['playerID'],
+        'indexes': {'player_league_pos': ['League', 'Pos'], 'player_club': ['Club']},
+    },
+    'player_game': {
+        'columns': [
+            ('matchID', ID), ('gw', 'TINYINT UNSIGNED NOT NULL'), ('playerID', ID), ('League', LEAGUE),
+            ('Club', 'VARCHAR(64)'), ('Pos', 'VARCHAR(32)'), ('Min', 'SMALLINT DEFAULT 0'), ('Num', 'TINYINT UNSIGNED'),
+        ] + [(col, 'DECIMAL(5,2) DEFAULT 0' if col in FLOAT_COLS else 'SMALLINT DEFAULT 0') for col in GAME_STATS],
+        'primary': ['playerID', 'gw'],
+        'indexes': {'player_game_match': ['matchID'], 'player_game_league_gw': ['League', 'gw']},
+        'foreign': ('player_game_fk', 'playerID', 'player'),
+    },
+}
+
+
+def stat_cols(cols):
+    """Split player_game columns into those player_stats sums and those it averages"""
+    non_cols = ['player', 'pos', 'gw', 'nation', 'club', 'league', 'num', 'age',
+                'playerid', 'player_url', 'matchid']
+    sum_cols = [col for col in cols if col.lower() not in non_cols and 'pct' not in col.lower(
+    ) and 'avg' not in col.lower()]
+    avg_cols = [col for col in cols if col.lower() not in non_cols and (
+        'pct' in col.lower() or 'avg' in col.lower())]
+    return sum_cols, avg_cols
+
+
+GAME_COLS = [col for col, _ in TABLES['player_game']['columns']]
+SUM_COLS, AVG_COLS = stat_cols(GAME_COLS)
+
+# season totals need more room than a single match
+TABLES['player_stats'] = {
+    'columns': [('playerID', ID), ('Pos', 'VARCHAR(32)'), ('Club', 'VARCHAR(64)'), ('League', LEAGUE)]
+    + [(col, 'DECIMAL(7,2) DEFAULT 0' if col in FLOAT_COLS else 'INT DEFAULT 0') for col in SUM_COLS]
+    + [(col, 'DECIMAL(5,2) DEFAULT 0') for col in AVG_COLS],
+    'primary': ['playerID'],
+    'indexes': {'player_stats_league_pos': ['League', 'Pos']},
+    'foreign': ('player_stats_fk', 'playerID', 'player'),
+}
+
+# per-player totals and averages over the last window_gws gameweeks up to last_gw, and the
+# top players per league, position group, window and stat; aggregates.py keeps both up to date
+TABLES['player_window'] = {
+    'columns': [('playerID', ID), ('window_gws', 'TINYINT UNSIGNED NOT NULL'), ('League', LEAGUE), ('Pos', 'VARCHAR(32)'),
+                ('Club', 'VARCHAR(64)'), ('last_gw', 'TINYINT UNSIGNED'), ('games', 'TINYINT UNSIGNED DEFAULT 0')]
+    + [(col, dtype) for col, dtype in TABLES['player_stats']['columns'][4:]],
+    'primary': ['playerID', 'window_gws'],
+    'indexes': {'player_window_league': ['League', 'window_gws']},
+    'foreign': ('player_window_fk', 'playerID', 'player'),
+}
+TABLES['leaderboard'] = {
+    'columns': [('League', LEAGUE), ('Pos', 'VARCHAR(8) NOT NULL'), ('window_gws', 'TINYINT UNSIGNED NOT NULL'),
+                ('stat', 'VARCHAR(32) NOT NULL'), ('place', 'TINYINT UNSIGNED NOT NULL'), ('playerID', ID),
+                ('value', 'DECIMAL(9,2)'), ('last_gw', 'TINYINT UNSIGNED')],
+    'primary': ['League', 'Pos', 'window_gws', 'stat', 'place'],
+    'indexes': {},
+}
+
+
+def quote(col):
+    return f'`{col}`'
+
+
+def table_columns(cursor, table):
+    """Lowercase names of a table's columns in the current database"""
+    cursor.execute('SELECT column_name FROM information_schema.columns '
+                   'WHERE table_schema = DATABASE() AND table_name = %s', (table,))
+    return {name.lower() for name, in cursor.fetchall()}
+
+
+def ensure_table(cursor, name):
+    """Create a registered table, or bring an existing one to its registered types and indexes"""
+    table = TABLES[name]
+    existing = table_columns(cursor, name)
+    foreign = table.get('foreign')
+
+    if not existing:
+        parts = [f'{quote(col)} {dtype}' for col, dtype in table['columns']]
+        parts.append(f'PRIMARY KEY ({", ".join(map(quote, table["primary"]))})')
+        parts += [f'INDEX {index} ({", ".join(map(quote, cols))})' for index, cols in table['indexes'].items()]
+        if foreign:
+            parts.append(f'CONSTRAINT {foreign[0]} FOREIGN KEY ({quote(foreign[1])}) REFERENCES {foreign[2]}({quote(foreign[1])})')
+        cursor.execute(f'CREATE TABLE {name} ({", ".join(parts)})')
+        return
+
+    # tables made by older versions: retype what's there, add what's missing, all in one rebuild
+    alters = [f'{"MODIFY" if col.lower() in existing else "ADD"} COLUMN {quote(col)} {dtype}'
+              for col, dtype in table['columns']]
+    cursor.execute('SELECT DISTINCT index_name FROM information_schema.statistics '
+                   'WHERE table_schema = DATABASE() AND table_name = %s', (name,))
+    indexes = {index for index, in cursor.fetchall()}
+    alters += [f'ADD INDEX {index} ({", ".join(map(quote, cols))})'
+               for index, cols in table['indexes'].items() if index not in indexes]
+    cursor.execute('SELECT constraint_name FROM information_schema.table_constraints '
+                   'WHERE table_schema = DATABASE() AND table_name = %s', (name,))
+    constraints = {constraint for constraint, in cursor.fetchall()}
+    if foreign and foreign[0] not in constraints:
+        alters.append(f'ADD CONSTRAINT {foreign[0]} FOREIGN KEY ({quote(foreign[1])}) REFERENCES {foreign[2]}({quote(foreign[1])})')
+    cursor.execute(f'ALTER TABLE {name} {", ".join(alters)}')
+
+
+def create_tables(cursor, names=('player', 'player_game', 'player_stats')):
+    for name in names:
+        ensure_table(cursor, name)
+
+    # player_stats used to be a copy of player_game; these don't belong in it
+    if 'player_stats' in names:
+        stats = table_columns(cursor, 'player_stats')
+        for col in ['matchID', 'gw', 'Num']:
+            if col.lower() in stats:
+                cursor.execute(f'ALTER TABLE player_stats DROP COLUMN {quote(col)}')
+
+
+def create_stats_triggers(cursor, cols=GAME_COLS):
+    """Per-row triggers that keep player_stats in step with one-off player_game edits
+
+    Bulk loads set @bulk_load to skip them and call db.refresh_player_stats
+    once per batch instead.
+    """
+    sum_cols, avg_cols = stat_cols(cols)
+
+    # procedure for checking if players are in player_stats, adding if not
+    player_procedure = """
+    CREATE PROCEDURE insert_player_stats (playerIDVar CHAR(8))
+    BEGIN
+        -- Check if playerID exists in player_stats table
+        IF NOT EXISTS (SELECT 1 FROM player_stats WHERE playerID = playerIDVar) THEN
+            -- playerID does not exist, insert it into player_stats table
+            SELECT Pos, Club, League INTO @playerPosVar, @PlayerClubVar, @PlayerLeagueVar
+            FROM player
+            WHERE playerID = playerIDVar;
+
+            -- Insert playerID, position, club and league into player_stats table
+            INSERT INTO player_stats (playerID, Pos, Club, League)
+            VALUES (playerIDVar, @playerPosVar, @PlayerClubVar, @PlayerLeagueVar);
+        END IF;
+    END;
+    """
+    cursor.execute('DROP PROCEDURE IF EXISTS insert_player_stats;')
+    cursor.execute(player_procedure)
+
+    # Define the trigger codes with placeholders for the column names
+    ins_trigger_code = """
+    CREATE TRIGGER update_player_stats_onIns AFTER INSERT ON player_game
+    FOR EACH ROW
+    BEGIN
+        IF @bulk_load IS NULL THEN
+            CALL insert_player_stats(NEW.playerID);
+
+            UPDATE player_stats
+            SET {sum_cols}
+            WHERE playerID = NEW.playerID;
+
+            UPDATE player_stats
+            SET {avg_cols}
+            WHERE playerID = NEW.playerID;
+        END IF;
+    END;
+    """
+
+    # other triggers
+    del_trigger_code = ins_trigger_code.replace(
+        'INSERT', 'DELETE').replace('onIns', 'onDel').replace('NEW', 'OLD')
+    upd_trigger_code = ins_trigger_code.replace(
+        'INSERT', 'UPDATE').replace('onIns', 'onUpd')
+    triggers = [ins_trigger_code, del_trigger_code, upd_trigger_code]
+
+    # Format the column names for summing
+    sum_cols_str = ', '.join(
+        f"{quote(col)} = {quote(col)} + NEW.{quote(col)}" for col in sum_cols)
+
+    # Format the column names for averaging
+    avg_cols_str = ', '.join(f"{quote(col)} = (\
+            SELECT AVG({quote(col)}) FROM player_game WHERE playerID = NEW.playerID)" for col in avg_cols)
+
+    # Format the trigger codes with the column names
+    for trigger in triggers:
+        # replace any existing trigger so older versions don't linger
+        drop_code = trigger.split(' AFTER ')[0].replace(
+            'CREATE TRIGGER', 'DROP TRIGGER IF EXISTS').strip() + ';'
+        cursor.execute(drop_code)
+        if 'AFTER DELETE ON' in trigger:
+            trigger_code = trigger.format(
+                sum_cols=sum_cols_str.replace('+ NEW', '- OLD'), avg_cols=avg_cols_str.replace('NEW', 'OLD'))
+        elif 'AFTER UPDATE ON' in trigger:
+            trigger_code = trigger.format(
+                sum_cols=sum_cols_str.replace('+ NEW', '- OLD.{} + NEW').format(*map(quote, sum_cols)), avg_cols=avg_cols_str)
+        else:
+            trigger_code = trigger.format(
+                sum_cols=sum_cols_str, avg_cols=avg_cols_str)
+        cursor.execute(trigger_code.strip())
+
+
+def create_pos_triggers(cursor):
+    # create triggers that update Pos in player_game and player_stats on inserts and updates to the player table
+    for event, suffix in [('INSERT', 'onIns'), ('UPDATE', 'onUpd')]:
+        cursor.execute(f'DROP TRIGGER IF EXISTS update_pos_{suffix};')
+        cursor.execute(f"""
+        CREATE TRIGGER update_pos_{suffix} AFTER {event} ON player
+        FOR EACH ROW
+        BEGIN
+            UPDATE player_game
+            SET Pos = NEW.Pos
+            WHERE playerID = NEW.playerID;
+
+            UPDATE player_stats
+            SET Pos = NEW.Pos
+            WHERE playerID = NEW.playerID;
+        END;
+        """)
+
+
+# (version, description, step) in the order they apply; never edit a released step, add a new one
+MIGRATIONS = [
+    (1, 'typed player, player_game and player_stats tables with secondary indexes', create_tables),
+    (2, 'player_stats and Pos triggers', lambda cursor: (create_stats_triggers(cursor), create_pos_triggers(cursor))),
+    (3, 'player_window and leaderboard summary tables', lambda cursor: create_tables(cursor, ['player_window', 'leaderboard'])),
+]
+
+
+def migrate(conn):
+    """Apply every migration the database hasn't had yet, returning its schema version"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version SMALLINT PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        current = cursor.fetchone()[0]
+
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            print(f'Migrating to schema version {version}: {description}')
+
+            # retyping key columns is only allowed with foreign key checks off
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+            try:
+                step(cursor)
+            finally:
+                cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+            cursor.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)', (version, description))
+            conn.commit()
+            current = version
+    return current
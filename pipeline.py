@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fetch import get_fetcher
+from match_report import parse_match_report
+from metrics import get_metrics
+
+# parsing is CPU-bound, so it gets its own processes; set FBREF_PARSE_WORKERS=1 to parse inline
+PARSE_WORKERS = int(os.environ.get('FBREF_PARSE_WORKERS', 0)) or max(1, (os.cpu_count() or 2) - 1)
+
+# pages fetched but not yet parsed, per worker; fetch threads wait once this many are queued
+PAGES_PER_WORKER = 2
+
+
+# workers come from a forkserver (or are spawned where there isn't one) rather than being forked
+# from this process, whose fetch and league threads could be holding locks the child would inherit
+MP_CONTEXT = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """The shared parsing process pool, restarted if the worker count changes"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT)
+            _pool_workers = workers
+        return _pool
+
+
+def parse(html, url):
+    # runs in a worker process; the report comes back as typed column arrays, with the seconds it took
+    start = time.perf_counter()
+    report = parse_match_report(html, url=url)
+    return report, time.perf_counter() - start
+
+
+def parsed(result, size):
+    # worker processes can't record metrics themselves, so the time is recorded as the report arrives
+    report, seconds = result
+    get_metrics().add('parse', seconds, match=report.match_id).count(bytes=size)
+    return report
+
+
+def iter_match_reports(urls, workers=None, fetch=None):
+    """Fetch match reports and parse them in a process pool, yielding them in the order of urls
+
+    Only urls within PAGES_PER_WORKER per worker of the next report to be
+    handed back are fetched, so every page and report held, whether being
+    fetched, queued, parsed or parsed and waiting behind a slower one, is
+    inside that window. A slow parse, a slow fetch or a slow consumer of
+    this generator holds back fetching instead of piling pages up in memory.
+    With one worker pages are parsed here as they're handed back, under the
+    same window.
+    """
+    workers = workers or PARSE_WORKERS
+    fetcher = get_fetcher()
+    fetch = fetch or fetcher.fetch
+    urls = list(urls)
+    inline = workers == 1 or len(urls) <= 1
+
+    limit = workers * PAGES_PER_WORKER
+    pages = queue.Queue()
+    cancelled = threading.Event()
+
+    # a slot is only given back once its report has been yielded, not when it's parsed
+    window = threading.Condition()
+    next_i = 0
+
+    def produce(i, url):
+        with window:
+            window.wait_for(lambda: i < next_i + limit or cancelled.is_set())
+        if cancelled.is_set():
+            return
+        try:
+            pages.put((i, fetch(url), None))
+        except Exception as e:
+            pages.put((i, None, e))
+
+    def handed_back(i):
+        nonlocal next_i
+        with window:
+            next_i = i + 1
+            window.notify_all()
+
+    pool = None if inline else get_pool(workers)
+    for i, url in enumerate(urls):
+        fetcher.executor.submit(produce, i, url)
+
+    futures = {}
+    sizes = {}
+    received = 0
+    try:
+        while next_i < len(urls):
+            # take pages while the window can still send one, unless the next report is ready;
+            # once every page in the window is in, wait for the report next in line
+            if received < min(next_i + limit, len(urls)) and not (next_i in futures and (inline or futures[next_i].done())):
+                i, html, error = pages.get()
+                if error is not None:
+                    raise error
+                futures[i] = html if inline else pool.submit(parse, html, urls[i])
+                sizes[i] = len(html)
+                received += 1
+                continue
+            result = parse(futures.pop(next_i), urls[next_i]) if inline else futures.pop(next_i).result()
+            report = parsed(result, sizes.pop(next_i))
+            handed_back(next_i)
+            yield report
+    finally:
+        with window:
+            cancelled.set()
+            window.notify_all()
+
+
+def parse_match_reports(urls, workers=None, fetch=None):
+    """Fetch and parse match reports, returning MatchReports in the order of urls"""
+    return list(iter_match_reports(urls, workers, fetch))
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pandas as pd
+
+POSITIONS_PATH = 'data/player_positions.csv'
+MAX_AGE_DAYS = 30
+COLUMNS = ['playerID', 'Pos', 'squad_pos', 'verified_at']
+
+
+class PositionStore:
+    """Persistent playerID -> position index backed by a csv
+
+    Each entry keeps the position scraped from the player's profile, the
+    position their squad page listed at the time, and when it was checked.
+    A player is only scraped again if they are new, their squad position
+    changed, or their entry is older than max_age_days.
+    """
+
+    def __init__(self, path=POSITIONS_PATH, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.max_age_days = max_age_days
+        if os.path.exists(path):
+            df = pd.read_csv(path, dtype={'playerID': str, 'Pos': str, 'squad_pos': str})
+        else:
+            df = pd.DataFrame(columns=COLUMNS)
+        # stores saved with a player twice would make every lookup fail, so only the latest entry is kept
+        self.df = df.drop_duplicates('playerID', keep='last').set_index('playerID')
+
+    def stale(self, ids, squad_pos=None):
+        """Boolean mask of the ids that need their profile scraped again"""
+        ids = pd.Series(ids).reset_index(drop=True)
+        known = self.df.reindex(ids)
+        expired = known['verified_at'].isna() | (
+            time.time() - known['verified_at'].astype(float) > self.max_age_days * 24 * 60 * 60)
+        mask = expired.to_numpy()
+        if squad_pos is not None:
+            mask |= known['squad_pos'].fillna('').astype(str).to_numpy() != pd.Series(squad_pos).to_numpy()
+        return mask
+
+    def update(self, ids, positions, squad_pos=None):
+        """Record freshly scraped positions for a batch of players"""
+        fresh = pd.DataFrame({
+            'Pos': list(positions),
+            'squad_pos': list(squad_pos) if squad_pos is not None else self.df['squad_pos'].reindex(ids).tolist(),
+            'verified_at': time.time(),
+        }, index=pd.Index(list(ids), name='playerID'))
+        fresh = fresh[~fresh.index.duplicated(keep='last')]
+        self.df = pd.concat([self.df[~self.df.index.isin(fresh.index)], fresh])
+
+    def lookup(self, df, scrape):
+        """Positions for each row of a frame with playerID, player_url and the squad's Pos
+
+        Only stale players are passed, in one batch, to scrape(urls); everyone
+        else is answered from the store. A player can be in df more than once
+        (e.g. a document under each club they've played for) but is only
+        scraped once.
+        """
+        squad_pos = df['Pos'].fillna('').astype(str) if 'Pos' in df else None
+        mask = self.stale(df['playerID'], squad_pos)
+        if mask.any():
+            stale = ~df['playerID'].duplicated(keep='last').to_numpy() & mask
+            print(f'Scraping positions for {stale.sum()} of {df["playerID"].nunique()} players...')
+            self.update(df['playerID'][stale], scrape(df['player_url'][stale].tolist()),
+                        squad_pos[stale] if squad_pos is not None else None)
+            self.save()
+        return df['playerID'].map(self.df['Pos'])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.df.reset_index()[COLUMNS].to_csv(self.path, index=False)
+
+
+_store = None
+
+
+def get_position_store():
+    global _store
+    if _store is None:
+        _store = PositionStore()
+    return _store
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# compact dtypes for the frames scraping returns, keyed by lowercase column
+# name so the same schema covers the sql-renamed frames db.py loads (Min, MP...)
+CATEGORY_COLS = [
+    'playerid', 'id', 'matchid', 'league', 'club', 'nation', 'position', 'pos', 'match_position',
+]
+
+# expected goals, percentages and averages are the only fractional stats
+FLOAT_COLS = [
+    'xg', 'npxg', 'xag', 'xa', 'psxg',
+    'cmppct', 'tklpct', 'succpct', 'tkldpct', 'wonpct', 'savepct', 'launchpct', 'stppct',
+    'avglen', 'avgdist',
+]
+
+# counts, minutes and distances in yards all fit in an int16
+INT_COLS = [
+    'gw', 'age', 'matches', 'mp', 'starts', 'mins', 'min', 'num',
+    'gls', 'ast', 'pk', 'pkatt', 'sh', 'sot', 'crdy', 'crdr', 'touches', 'tkl', 'interceptions', 'blocks',
+    'sca', 'gca', 'cmp', 'att', 'prgp', 'carries', 'prgc', 'succ', 'totdist', 'prgdist', 'kp',
+    'passes_final_third', 'ppa', 'crspa', 'live', 'dead', 'fk', 'tb', 'sw', 'crs', 'ti', 'ck',
+    'inswinging', 'outswinging', 'str', 'pass_offside', 'tklw', 'def_3rd', 'mid_3rd', 'att_3rd',
+    'lost', 'pass', 'tklandinterceptions', 'clr', 'err', 'def_pen', 'att_pen', 'tkld', 'cpa', 'mis',
+    'dis', 'rec', 'prgr', 'secondcrdy', 'fls', 'fld', 'pkwon', 'pkcon', 'og', 'recov', 'won',
+    'sota', 'ga', 'saves', 'att_gk', 'thr', 'opp', 'stp', 'numopa',
+]
+
+SCHEMA = {
+    **{col: 'category' for col in CATEGORY_COLS},
+    **{col: 'float32' for col in FLOAT_COLS},
+    **{col: 'int16' for col in INT_COLS},
+}
+
+
+def int_dtype(values):
+    """Smallest signed int that holds every value, or float32 if they aren't all whole numbers"""
+    if np.isnan(values).any() or (values != np.floor(values)).any():
+        return 'float32'
+    for dtype in ['int16', 'int32']:
+        info = np.iinfo(dtype)
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return dtype
+    return 'int64'
+
+
+def apply_schema(df):
+    """Cast a frame's columns to their declared compact dtypes
+
+    Declared int16 columns are widened if a value doesn't fit, and become
+    float32 if any value isn't whole, so no value changes. Columns the
+    schema doesn't know are left alone.
+    """
+    columns = {}
+    for col in df.columns:
+        dtype = SCHEMA.get(col.lower())
+        if dtype is None or str(df[col].dtype) == dtype:
+            continue
+        if dtype == 'category':
+            columns[col] = df[col].astype('category')
+        elif dtype == 'float32':
+            columns[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+        else:
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64)
+            columns[col] = values.astype(int_dtype(values))
+    if not columns:
+        return df
+    return df.assign(**columns)
+
+
+def widen(df):
+    """float32 columns back to float64 at the precision fbref gave them, for frames leaving memory
+
+    float32 is only for holding frames; 0.3 in a float32 is
+    0.30000001192092896 as a float64, which is what sinks and exports would
+    otherwise write. Every value is parsed back from its shortest float32
+    repr, so the decimals fbref printed are all that's kept.
+    """
+    columns = {col: df[col].to_numpy().astype(str).astype(np.float64)
+               for col in df.columns if df[col].dtype == np.float32}
+    if not columns:
+        return df
+    return df.assign(**columns)
+
+
+def concat(frames):
+    """Concatenate schema'd frames without categoricals decaying to object
+
+    pd.concat only keeps a categorical if every frame has the same
+    categories, so union the categories first.
+    """
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    categorical = [col for col in frames[0].columns
+                   if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames if col in frame)]
+    categories = {col: union_categoricals([frame[col] for frame in frames if col in frame]).categories
+                  for col in categorical}
+    frames = [frame.assign(**{col: frame[col].cat.set_categories(categories[col]) for col in categorical if col in frame})
+              for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_report(before, after, label='frame'):
+    """Print how much memory a schema saved; returns (before, after) bytes"""
+    old = before.memory_usage(deep=True).sum()
+    new = after.memory_usage(deep=True).sum()
+    print(f'{label}: {old / 1024:.0f} KB -> {new / 1024:.0f} KB ({new / old:.0%})' if old else f'{label}: empty')
+    return old, new
@@ -0,0 +1,225 @@
+"""Fantasy points for player_match rows, scored a whole season at a time
+
+    python scoring.py [--leagues ...] [--season 2023-2024] [--full]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from leagues import URLS
+from scraping import current_season
+
+# position groups scoring weights are given for, and the group of each position fbref lists
+GROUPS = ['GK', 'DEF', 'MID', 'FWD']
+POSITION_GROUPS = {
+    'GK': 'GK', 'Goalkeeper': 'GK',
+    'DF': 'DEF', 'CB': 'DEF', 'FB': 'DEF', 'LB': 'DEF', 'RB': 'DEF', 'WB': 'DEF', 'Center Back': 'DEF', 'Fullback': 'DEF',
+    'MF': 'MID', 'DM': 'MID', 'CM': 'MID', 'AM': 'MID', 'LM': 'MID', 'RM': 'MID', 'Midfielder': 'MID',
+    'Att Mid / Winger': 'MID',
+    'FW': 'FWD', 'LW': 'FWD', 'RW': 'FWD', 'CF': 'FWD', 'ST': 'FWD', 'Forward': 'FWD',
+}
+DEFAULT_GROUP = 'MID'
+
+# points per `per` of a stat, the same for everyone or by position group (groups left out score 0);
+# min_mins only awards the rule to players on the pitch that long
+RULES = [
+    {'stat': 'played', 'points': 1},
+    {'stat': 'played_60', 'points': 1},
+    {'stat': 'gls', 'points': {'GK': 6, 'DEF': 6, 'MID': 5, 'FWD': 4}},
+    {'stat': 'ast', 'points': 3},
+    {'stat': 'clean_sheet', 'points': {'GK': 4, 'DEF': 4, 'MID': 1}, 'min_mins': 60},
+    {'stat': 'conceded', 'points': {'GK': -1, 'DEF': -1}, 'per': 2, 'min_mins': 60},
+    {'stat': 'saves', 'points': {'GK': 1}, 'per': 3},
+    {'stat': 'pk_missed', 'points': -2},
+    {'stat': 'crdy', 'points': -1},
+    {'stat': 'crdr', 'points': -3},
+    {'stat': 'og', 'points': -2},
+]
+
+# stats the rules use that aren't scraped columns; conceded is added before these run
+DERIVED = {
+    'played': lambda stats: stats('mins') > 0,
+    'played_60': lambda stats: stats('mins') >= 60,
+    'pk_missed': lambda stats: stats('pkatt') - stats('pk'),
+    'clean_sheet': lambda stats: stats('conceded') == 0,
+}
+
+# identifying columns carried over from the scored rows
+ID_COLS = ['league', 'season', 'gw', 'matchid', 'playerid', 'club']
+
+
+def compile_rules(rules=RULES):
+    """(stat, per, min_mins, weights by group index) for each rule"""
+    compiled = []
+    for rule in rules:
+        points = rule['points']
+        if isinstance(points, dict):
+            weights = np.array([points.get(group, 0) for group in GROUPS], dtype=np.float32)
+        else:
+            weights = np.full(len(GROUPS), points, dtype=np.float32)
+        compiled.append((rule['stat'], rule.get('per', 1), rule.get('min_mins', 0), weights))
+    return compiled
+
+
+def group_codes(frame, positions=None):
+    """Index into GROUPS for every row
+
+    The position is taken from the frame's position column, else from
+    positions (playerid -> position), else from the match_position the
+    player played in that match.
+    """
+    cols = {col.lower(): col for col in frame.columns}
+    col = cols.get('position', cols.get('pos'))
+    pos = frame[col].astype(object) if col else pd.Series(None, index=frame.index, dtype=object)
+    if positions is not None:
+        playerid = frame[cols['playerid']].astype(str)
+        looked_up = playerid.map(pd.Series(positions).rename(index=str))
+        pos = pos.where(pos.notna() & (pos != 'N/A'), looked_up)
+    if 'match_position' in cols:
+        pos = pos.where(pos.notna() & (pos != 'N/A'), frame[cols['match_position']].astype(object))
+
+    # only the distinct positions are mapped; a player listed in several scores in the first
+    codes, uniques = pd.factorize(pos)
+    groups = pd.Index(uniques.astype(str)).str.split(',').str[0].str.strip().map(POSITION_GROUPS)
+    group_index = np.array([GROUPS.index(group if isinstance(group, str) else DEFAULT_GROUP) for group in groups]
+                           + [GROUPS.index(DEFAULT_GROUP)], dtype=np.intp)
+    return group_index[codes]
+
+
+def conceded(frame, matches=None):
+    """Goals each row's club conceded in its match
+
+    From the fixture's score where matches (get_matches rows: id, home, away,
+    home_score, away_score) has it, otherwise the sum of its keepers' GA.
+    Rows are put on a side by their is_home flag, or failing that by their
+    club's name in the fixture, which fbref doesn't always spell the same.
+    """
+    cols = {col.lower(): col for col in frame.columns}
+    keys = pd.DataFrame({'matchid': frame[cols['matchid']].astype(str).to_numpy(),
+                         'club': frame[cols['club']].astype(str).to_numpy()})
+    if 'ga' in cols:
+        ga = pd.to_numeric(frame[cols['ga']], errors='coerce').fillna(0).to_numpy()
+        result = keys.assign(ga=ga).groupby(['matchid', 'club'])['ga'].transform('sum').to_numpy(np.float32)
+    else:
+        result = np.zeros(len(frame), dtype=np.float32)
+    if matches is None or not len(matches):
+        return result
+
+    # penalty shoot-outs show as "(4) 1–1 (3)"; only the goals in play count
+    def goals(scores):
+        return pd.to_numeric(scores.astype(str).str.replace(r'\(\d+\)', '', regex=True).str.strip(), errors='coerce')
+
+    fixtures = pd.DataFrame({'matchid': matches['id'].astype(str), 'home': matches['home'].astype(str),
+                             'away': matches['away'].astype(str), 'home_goals': goals(matches['home_score']),
+                             'away_goals': goals(matches['away_score'])}).drop_duplicates('matchid')
+    fixture = keys.merge(fixtures, on='matchid', how='left')
+
+    # 1 for the home side, 0 for the away side, NaN where neither says
+    by_name = np.where(fixture['club'] == fixture['home'], 1.0, np.where(fixture['club'] == fixture['away'], 0.0, np.nan))
+    side = frame[cols['is_home']].map({True: 1.0, False: 0.0}).to_numpy(np.float64) if 'is_home' in cols else by_name
+    side = np.where(np.isnan(side), by_name, side)
+    from_scores = np.where(side == 1, fixture['away_goals'], np.where(side == 0, fixture['home_goals'], np.nan))
+    return np.where(np.isnan(from_scores), result, from_scores).astype(np.float32)
+
+
+def score(frame, positions=None, matches=None, rules=RULES, breakdown=False):
+    """Points for every row of a player_match (or player_game) frame in one vectorized pass
+
+    Column names are matched case-insensitively, so store reads and sql
+    reads both work. Stats a frame doesn't have count as 0. Returns the
+    identifying columns, the position group and points, plus one column
+    per rule with breakdown=True.
+    """
+    cols = {col.lower(): col for col in frame.columns}
+
+    # player_game calls minutes Min
+    if 'mins' not in cols and 'min' in cols:
+        cols['mins'] = cols['min']
+    cache = {'conceded': conceded(frame, matches) if 'matchid' in cols and 'club' in cols else np.zeros(len(frame))}
+
+    def stats(name):
+        if name not in cache:
+            if name in DERIVED:
+                cache[name] = np.asarray(DERIVED[name](stats), dtype=np.float32)
+            elif name in cols:
+                cache[name] = pd.to_numeric(frame[cols[name]], errors='coerce').fillna(0).to_numpy(np.float32)
+            else:
+                cache[name] = np.zeros(len(frame), dtype=np.float32)
+        return cache[name]
+
+    groups = group_codes(frame, positions)
+    mins = stats('mins')
+    points = np.zeros(len(frame), dtype=np.float32)
+    parts = {}
+    for stat, per, min_mins, weights in compile_rules(rules):
+        values = stats(stat)
+        if per != 1:
+            values = np.floor(values / per)
+        rule_points = values * weights[groups]
+        if min_mins:
+            rule_points = np.where(mins >= min_mins, rule_points, 0)
+        points += rule_points
+        if breakdown:
+            parts[f'points_{stat}'] = rule_points
+
+    result = pd.DataFrame({col: frame[cols[col]].to_numpy() for col in ID_COLS if col in cols}, index=frame.index)
+    result['group'] = pd.Categorical.from_codes(groups, categories=GROUPS)
+    result['points'] = points
+    return result.assign(**parts)
+
+
+def stale_gws(league, season, root=None):
+    """Gameweeks with player_match rows written since they were last scored, or never scored"""
+    # the parquet store (and pyarrow) is only needed here, not by score() callers like aggregates
+    import store
+
+    root = root or store.STORE_DIR
+    scored = store.gameweeks('points', league, season, root)
+    return sorted(gw for gw, written in store.gameweeks('player_match', league, season, root).items()
+                  if gw not in scored or written > scored[gw])
+
+
+def rescore(league, season=None, root=None, full=False, rules=RULES):
+    """Score the gameweeks of a season whose player_match rows changed since they were scored
+
+    Reads just those gameweeks from the store, scores them in one batch and
+    writes each gameweek's points back as the points dataset. Positions
+    come from the season's players, falling back to the one played in the
+    match, and clean sheets from its matches, when the store has them.
+    Returns the points scored.
+    """
+    import store
+
+    root = root or store.STORE_DIR
+    season = season or current_season()
+    gws = sorted(store.gameweeks('player_match', league, season, root)) if full else stale_gws(league, season, root)
+    if not gws:
+        return pd.DataFrame(columns=ID_COLS + ['group', 'points'])
+
+    frame = store.read('player_match', league=league, season=season, gws=gws, root=root)
+    positions = matches = None
+    if os.path.isdir(store.partition_dir('players', root, league=league, season=season)):
+        players = store.read('players', columns=['ID', 'position'], league=league, season=season, root=root)
+        positions = players.drop_duplicates('ID').set_index('ID')['position']
+    if os.path.isdir(os.path.join(root, 'matches')):
+        matches = store.read('matches', league=league, season=season, gws=gws, root=root)
+
+    points = score(frame, positions, matches, rules)
+    for gw, gw_points in points.groupby('gw'):
+        store.write(gw_points, 'points', root=root, league=league, season=season, gw=gw)
+    return points
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leagues', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--season', default=current_season())
+    parser.add_argument('--full', action='store_true', help='rescore every gameweek, e.g. after changing RULES')
+    args = parser.parse_args()
+
+    for league in args.leagues:
+        points = rescore(league, args.season, full=args.full)
+        gws = sorted(points['gw'].unique()) if len(points) else []
+        print(f'{league} {args.season}: scored {len(points)} player matches in gameweeks {gws or "-"}')
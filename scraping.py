@@ -1,149 +1,241 @@
+import datetime
+
 import pandas as pd
 import numpy as np
-import requests
-from bs4 import BeautifulSoup as bs
-import time
-from urllib.request import urlopen, Request
+from io import StringIO
 from lxml import etree
 
+from fetch import fetch, fetch_many
+from leagues import URLS
+from match_report import assemble
+from metrics import timed
+from pipeline import iter_match_reports, parse_match_reports
+from positions import get_position_store
+from schema import apply_schema, memory_report
+
 HOME_URL = 'https://fbref.com/'
-URLS = {
-    'Premier League': {
-        'matches': 'https://fbref.com/en/comps/9/schedule/Premier-League-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/9/Premier-League-Stats'
-    },
-    'La Liga': {
-        'matches': 'https://fbref.com/en/comps/12/schedule/La-Liga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/12/La-Liga-Stats'
-    },
-    'Serie A': {
-        'matches': 'https://fbref.com/en/comps/11/schedule/Serie-A-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/11/Serie-A-Stats'
-    },
-    'Bundesliga': {
-        'matches': 'https://fbref.com/en/comps/20/schedule/Bundesliga-Scores-and-Fixtures',
-        'players': 'https://fbref.com/en/comps/20/Bundesliga-Stats'}
-}
-
-
-def get_dataframe(url, gw=None):
-    time.sleep(3)
-    df = pd.read_html(url, extract_links='all')[0]
-
-    # remove null values from tuples
-    df = df.applymap(lambda x: x if x[1] else x[0])
-
-    # remove the second value of each tuple from the column names
-    df.columns = df.columns.map(lambda x: x[0])
-
-    # convert columns to numeric where possible
-    df = df.apply(pd.to_numeric, errors='ignore')
-
-    # select gw if specified
-    if gw:
-        df = df[df['Wk'] == gw]
 
-    return df
+
+def read_html(html, **kwargs):
+    return pd.read_html(StringIO(html), extract_links='all', **kwargs)
+
+
+# columns that stay text when a player table is converted to numbers
+TEXT_COLS = ['playerID', 'player_url', 'Player', 'Nation', 'Pos', 'Club', 'League', 'Squad', 'Matches']
+
+def split_links(df):
+    """Split a read_html(extract_links='all') frame into a text frame and a link frame
+
+    Every cell is a (text, link) tuple, so the whole frame is unpacked in one
+    array conversion instead of per-cell lambdas. Headers keep the text of
+    their last level.
+    """
+    columns = [col[-1][0] if isinstance(col[0], tuple) else col[0] for col in df.columns]
+    cells = df.to_numpy().ravel()
+
+    # cells read_html padded for short rows come back as NaN instead of a tuple
+    for i in np.flatnonzero(pd.isna(cells)):
+        cells[i] = ('', None)
+    cells = np.array(cells.tolist(), dtype=object).reshape(df.shape + (2,))
+
+    text = pd.DataFrame(cells[:, :, 0], index=df.index, columns=columns, dtype=object)
+    links = pd.DataFrame(cells[:, :, 1], index=df.index, columns=columns, dtype=object)
+    return text, links
+
+def to_numeric(df, text_cols=None):
+    """Convert columns to numbers
+
+    With a text_cols schema every other column is converted in one block,
+    blanks and stray text becoming NaN and whole-number columns without
+    blanks becoming ints. Without one a column is only converted if every
+    value parses, like the old errors='ignore'.
+    """
+    if text_cols is None:
+        df = df.copy()
+        for col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+        return df
+
+    cols = [col for col, dtype in df.dtypes.items() if col not in text_cols and dtype == object]
+    if not cols:
+        return df
+    values = df[cols].to_numpy(dtype=object)
+    try:
+        numbers = values.astype(np.float64)
+    except (ValueError, TypeError):
+        # thousands separators or stray text: strip commas and coerce the rest
+        flat = pd.Series(values.ravel()).str.replace(',', '', regex=False)
+        numbers = pd.to_numeric(flat, errors='coerce').to_numpy(np.float64).reshape(values.shape)
+
+    integral = ~np.isnan(numbers).any(axis=0) & (numbers == np.floor(numbers)).all(axis=0)
+    numeric = pd.DataFrame({col: numbers[:, j].astype(np.int64) if integral[j] else numbers[:, j]
+                            for j, col in enumerate(cols)}, index=df.index)
+    return pd.concat([df.drop(columns=cols), numeric], axis=1)[df.columns]
+
+def get_dataframe(url, gw=None, links=()):
+    """Read the first table on a page as text, plus a <col>_link column for each of links"""
+    with timed('get_dataframe', url=url) as unit:
+        df, link_df = split_links(read_html(fetch(url))[0])
+        for col in links:
+            df[f'{col}_link'] = link_df[col]
+
+        # convert columns to numeric where possible
+        df = to_numeric(df)
+
+        # select gw if specified
+        if gw:
+            df = df[df['Wk'] == gw]
+
+        unit.count(rows=len(df))
+        return df
+
+def match_id(link):
+    """Get the match id from a match report link, e.g. /en/matches/<id>/<slug>"""
+    return link.rstrip('/').split('/')[-2]
+
+def current_season(today=None):
+    """fbref season name for a date, e.g. '2023-2024'; seasons roll over in July"""
+    today = today or datetime.date.today()
+    start = today.year if today.month >= 7 else today.year - 1
+    return f'{start}-{start + 1}'
+
+class ScheduleIndex:
+    """A league's fixture list, fetched and parsed once per run
+
+    Played matches are indexed by gameweek and by match id so loaders can
+    slice the schedule from memory instead of downloading it again.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        df = get_dataframe(url, links=['Score'])
+
+        # only matches with a score have a match report link
+        df = df[df['Score_link'].notna()].copy()
+        df['Wk'] = df['Wk'].astype(int)
+        df['ID'] = df['Score_link'].str.split('/').str[3]
+        self.df = df
+
+        self.gameweeks = {gw: frame for gw, frame in df.groupby('Wk')}
+
+        # the season the first played match falls in
+        dates = pd.to_datetime(df['Date'], errors='coerce').dropna() if 'Date' in df else pd.Series([], dtype='datetime64[ns]')
+        self.season = current_season(dates.min().date() if len(dates) else None)
+        self.matches = {row.ID: row for row in df.itertuples(index=False)}
+
+    def gameweek(self, gw):
+        """Played fixtures for a gameweek"""
+        if gw not in self.gameweeks:
+            return self.df.iloc[:0].copy()
+        return self.gameweeks[gw].copy()
+
+    def match(self, match_id):
+        return self.matches[match_id]
+
+    def fixture(self, match_id):
+        """One match's fields as get_matches returns them"""
+        row = self.matches[match_id]
+        scores = row.Score.split('–')
+        return {'id': match_id, 'gw': row.Wk, 'home': row.Home, 'away': row.Away,
+                'home_score': scores[0], 'away_score': scores[1]}
+
+    def match_urls(self, gw, match_ids=None):
+        df = self.gameweek(gw)
+        if match_ids is not None:
+            df = df[df['ID'].isin(match_ids)]
+        return (HOME_URL[:-1] + df['Score_link']).tolist()
+
+_schedules = {}
+
+def get_schedule(url):
+    """Return the ScheduleIndex for a league's fixtures url, parsing it on first use"""
+    if url not in _schedules:
+        _schedules[url] = ScheduleIndex(url)
+    return _schedules[url]
 
 def get_player_pos(url):
     """Scrape player position from their profile page"""
-
-    # get url for each player and scrape their page to get actual position
-    time.sleep(3)
-    req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-    response = urlopen(req)
-    htmlparser = etree.HTMLParser()
-    tree = etree.parse(response, htmlparser)
-
-    # get their specific position if they have a scout report
-    try:
-        pos = tree.xpath('//div[@id="all_similar"]/div[@class="filter switcher"]/div/a')[0].text[:-1]
-    except IndexError:
-        # if they don't have a scout report, get their general position
-        pos = tree.xpath('//div[@id="meta"]//p/strong[text()="Position:"]/../text()')[0].strip()
-        if '(' in pos:
-            pos = pos.split('(')[-1].split(')')[0]
-            if '-' in pos:
-                pos = pos.split('-')[0]
-        else:
-            pos = pos[:2]
-    return pos
+    return parse_player_pos(fetch(url))
+
+def get_player_positions(urls):
+    """Scrape positions for many players concurrently"""
+    return [parse_player_pos(html) for html in fetch_many(urls)]
+
+def parse_player_pos(html):
+    """Read player position from the html of their profile page"""
+    with timed('player_pos'):
+        tree = etree.fromstring(html, etree.HTMLParser())
+
+        # get their specific position if they have a scout report
+        try:
+            pos = tree.xpath('//div[@id="all_similar"]/div[@class="filter switcher"]/div/a')[0].text[:-1]
+        except IndexError:
+            # if they don't have a scout report, get their general position
+            pos = tree.xpath('//div[@id="meta"]//p/strong[text()="Position:"]/../text()')[0].strip()
+            if '(' in pos:
+                pos = pos.split('(')[-1].split(')')[0]
+                if '-' in pos:
+                    pos = pos.split('-')[0]
+            else:
+                pos = pos[:2]
+        return pos
 
 def clean_columns(df, pos=False):
+    """Clean a read_html(extract_links='all') player table with column-level string ops"""
+    with timed('clean_columns') as unit:
+        df, links = split_links(df)
+
+        # drop duplicate columns, blank strings become NaN
+        keep = ~df.columns.duplicated()
+        df = df.loc[:, keep].replace('', np.nan)
+        links = links.loc[:, keep]
+
+        # keep rows with a linked player, which drops the squad/opponent total rows
+        df = df[df['Player'].notna() & links['Player'].notna()].copy()
+        player_links = links.loc[df.index, 'Player']
+
+        # make player_url and playerID columns, playerID first
+        df['player_url'] = HOME_URL[:-1] + player_links
+        df.insert(0, 'playerID', player_links.str.split('/').str[-2])
+
+        # update position and drop empties
+        if pos:
+            # look positions up in the store, scraping only new or stale players
+            df['Pos'] = get_position_store().lookup(df, get_player_positions)
+
+            # drop rows with empty position
+            df = df.dropna(subset=['Pos'])
+            df['Pos'] = df['Pos'].str.split(',').str[0]
+
+        # split Nation on space and take last value, dropping rows with no nation
+        if 'Nation' in df.columns:
+            df = df.dropna(subset=['Nation'])
+            df['Nation'] = df['Nation'].str.split(' ').str[-1]
+
+        # take first value from Age column, dropping rows with no age
+        if 'Age' in df.columns:
+            df = df.dropna(subset=['Age'])
+            df['Age'] = df['Age'].str.split('-').str[0]
+
+        # convert stats to numbers and fill all empty values with 0
+        df = to_numeric(df, TEXT_COLS)
+        df = df.fillna(0)
 
-    # drop duplicate player column if it exists, remove empty players
-    df = df.loc[:, ~df.columns.duplicated()]
-    df = df.replace(r'^\s*$', np.nan, regex=True)
-    df = df.dropna(subset=['Player'])
-
-    # remove last row if it's a sum of all other rows
-    if df['Player'].str.contains('Players').any():
-        df = df[:-1]
-
-    # if second value in player tuple is none remove the row from the dataframe
-    df = df[df['Player'].map(lambda x: x[1] is not None)]
-
-    # make player_url a column
-    df['player_url'] = df['Player'].map(lambda x: HOME_URL[:-1] + x[1])
-
-    # update position and drop empties
-    if pos:
-        # iterate through each player_url and get their position
-        for url in df['player_url']:
-            pos = get_player_pos(url)
-            df.loc[df['player_url'] == url, 'Pos'] = pos
-
-        # drop rows with empty position
-        df = df.dropna(subset=['Pos'])
-        df['Pos'] = df['Pos'].map(lambda x: x.split(',')[0])
-
-    # extract player id from player column
-    if isinstance(df['Player'].iloc[0], tuple):
-        df['playerID'] = df['Player'].map(lambda x: x[1].split('/')[-2])
-        df['Player'] = df['Player'].map(lambda x: x[0])
-
-    # move playerID to first column
-    cols = df.columns.tolist()
-    cols = cols[-1:] + cols[:-1]
-    df = df[cols]
-
-    # change all tuple columns to their first value
-    df = df.applymap(lambda x: x[0] if isinstance(x, tuple) else x)
-
-    # split Nation on space and take last value
-    if 'Nation' in df.columns:
-        # drop rows with empty nation
-        df = df.dropna(subset=['Nation'])
-        df['Nation'] = df['Nation'].map(lambda x: x.split(' ')[-1])
-
-    # take first value from Age column
-    if 'Age' in df.columns:
-        # drop rows with empty age
-        df = df.dropna(subset=['Age'])
-        df['Age'] = df['Age'].map(lambda x: x.split('-')[0])
-
-    # fill all na or empty values with 0
-    df = df.replace(r'^\s*$', np.nan, regex=True)
-    df = df.fillna(0)
-
-    return df
-
-def get_matches(url, gw, export=False):
-    df = get_dataframe(url, gw=gw)
-    
-    # drop postponed matches or matches with no score listed
-    df.Score.replace('', np.nan, inplace=True)
-    df.dropna(subset=['Score'], inplace=True)
-
-    # get match id
-    df['ID'] = df['Score'].map(lambda x: x[1].split('/')[2])
+        unit.count(rows=len(df))
+        return df
 
-    # get second value from score column and first value from other tuples
-    df = df.applymap(lambda x: x[0] if isinstance(x, tuple) else x)
+def get_matches(url, gw, export=False, schedule=None):
+    # played matches for the gameweek, with their ids
+    schedule = schedule or get_schedule(url)
+    df = schedule.gameweek(gw)
 
     # get home and away score
-    df['home_score'] = df['Score'].map(lambda x: x.split('–')[0])
-    df['away_score'] = df['Score'].map(lambda x: x.split('–')[1])
+    scores = df['Score'].str.split('–')
+    df['home_score'] = scores.str[0]
+    df['away_score'] = scores.str[1]
 
     # rename Wk to gw and change cols to lowercase
     df.rename(columns={'Wk': 'gw'}, inplace=True)
@@ -152,132 +244,114 @@ def get_matches(url, gw, export=False):
 
     # export if specified
     if export:
-        league = url.split('/')[-1].replace('-Scores-and-Fixtures', '')
-        df.to_csv(f'data/match_data/{league}_gw{gw}.csv', index=False)
+        import store
+        league = next((league for league, urls in URLS.items() if urls['matches'] == url),
+                      url.split('/')[-1].replace('-Scores-and-Fixtures', ''))
+        store.write(df, 'matches', league=league, season=schedule.season, gw=gw)
 
     return df
 
 
-def get_player_match_data(league, gw, export=False):
-    # get dataframe from url
-    url = URLS[league]['matches']
-    df = get_dataframe(url, gw=gw)
-
-    # drop postponed matches or matches with no score listed
-    df.Score.replace('', np.nan, inplace=True)
-    df.dropna(subset=['Score'], inplace=True)
-
-    # get link from each match in dataframe
-    matches = [f'https://fbref.com{x}' for x in df.Score.map(lambda x: x[1])]
-
-    # create empty dataframe to store match data
-    gw_df = pd.DataFrame(columns=['Player', 'playerID'])
-
-    # loop through each match and get match data
-    for match in matches:
-
-        # extract data, create empty dataframe for storage
-        time.sleep(3)
-        df = pd.read_html(match, extract_links='all')[3:]
-        # create empty dataframe to store match data with playerID column dtype set to string
-        match_df = pd.DataFrame(columns=['Player', 'playerID', 'Club']).astype({'playerID': str})
+def player_match_frame(reports, league, gw, label=None):
+    """Join parsed match reports into typed player_match rows, one per player per match"""
+    with timed('player_match_frame', league=league, gw=gw) as unit:
+        gw_df = assemble(reports)
 
-        # get team names
-        data = requests.get(match).text
-        soup = bs(data, 'html.parser')
+        # the scorebox lists the home side first; scores are matched to rows by side, not by club name
+        home = {report.match_id: report.teams[0] for report in reports}
+        gw_df['is_home'] = gw_df['Club'] == gw_df['matchID'].map(home)
 
-        # get team names and assign to corresponding dfs
-        df_lst = [x for x in df if 'Event' not in [col[-1][0] for col in x.columns]]
+        # the accurate position is in player data; the one played in the match is kept as a fallback
+        gw_df = gw_df.rename(columns={'Pos': 'match_position'})
 
-        # add teams to df
-        teams = [x.find('a').text for x in soup.find_all('strong') if x.find(
-            'a') and '/en/squads/' in x.find('a')['href']]
-        print(f'GW {gw}: Retrieving data for {teams[0]} vs. {teams[1]}')
-        team_a = df_lst[:len(df_lst)//2]
-        team_b = df_lst[len(df_lst)//2:]
-        for x in team_a:
-            x['Club'] = teams[0]
-        for x in team_b:
-            x['Club'] = teams[1]
-        df_lst = team_a + team_b
+        # convert to numeric values, keeping ids as text even when they happen to be all digits
+        gw_df = to_numeric(gw_df).assign(playerID=gw_df['playerID'], matchID=gw_df['matchID'])
 
-        for df in df_lst:
-            # Remove first part of multi-index
-            df.columns = [col[-1][0] if col != 'Club' else col for col in df.columns]
+        # move gw column to first column
+        gw_df['gw'] = gw
+        cols = gw_df.columns.tolist()
+        cols = cols[-1:] + cols[:-1]
+        gw_df = gw_df[cols]
 
-            # Remove null values from tuples
-            df = df.applymap(lambda val: val if val[1] else val[0])
+        # rename columns to be sql-friendly
+        cols = gw_df.columns.tolist()
+        gw_df.columns = [sub.replace('Int', 'Interceptions').replace(
+            '%', 'Pct').replace('1/3', 'Passes_Final_Third').replace('2', 'Second').replace('Out', 'Outswinging').replace('Off', 'Pass_Offside').replace('+', 'And')
+            .replace('#', 'Num').replace(' (', '_').replace(')', '')
+            .replace(' ', '_') if sub != 'In' else 'Inswinging' for sub in cols]
+        gw_df = gw_df.fillna({col: 0 for col in gw_df.columns if col != 'match_position'})
 
-            # Make playerID column
-            df = clean_columns(df)
+        # drop num column, add league and pos columns
+        gw_df['League'] = league
+        gw_df['Pos'] = 'N/A'
 
-            # Convert to numeric values
-            df = df.apply(pd.to_numeric, errors='ignore')
+        # drop all these columns
+        cols = ['player_url', 'gw', 'Player', 'Pos', 
+                'Nation', 'Age']
+        gw_df = gw_df.drop(columns=cols)
 
-            # Check for 'Event' column before merging
-            if 'Event' not in df.columns:
-
-                # set playerID column in df to string type
-                df['playerID'] = df['playerID'].astype(str)
-
-                # Merge with match_df on player and player_id columns
-                match_df = pd.merge(match_df, df, how='outer')
-
-        # Group by player and player_id, take non-null value
-        match_df = match_df.groupby(['Player', 'playerID', 'Club']).first().reset_index()
-
-        # drop position column since accurate version is in player data
-        match_df = match_df.drop(columns='Pos')
-        
-        # get match id 
-        match_id = match.split('/')[-2]
-        match_df['matchID'] = match_id
-
-        # add match_df to gw_df
-        gw_df = pd.concat([gw_df, match_df], ignore_index=True)
-        print('Done.\n--------------------------')
-
-    # convert to numeric values
-    gw_df = gw_df.apply(pd.to_numeric, errors='ignore')
-
-    # move gw column to first column
-    gw_df['gw'] = gw
-    cols = gw_df.columns.tolist()
-    cols = cols[-1:] + cols[:-1]
-    gw_df = gw_df[cols]
-
-    # rename columns to be sql-friendly
-    cols = gw_df.columns.tolist()
-    gw_df.columns = [sub.replace('Int', 'Interceptions').replace(
-        '%', 'Pct').replace('1/3', 'Passes_Final_Third').replace('2', 'Second').replace('Out', 'Outswinging').replace('Off', 'Pass_Offside').replace('+', 'And')
-        .replace(' ', '_') if sub != 'In' else 'Inswinging' for sub in cols]
-    gw_df = gw_df.fillna(0)
-
-    # drop num column, add league and pos columns
-    gw_df['League'] = league
-    gw_df['Pos'] = 'N/A'
-
-    # drop all these columns
-    cols = ['player_url', 'gw', 'Player', 'Pos', 
-            'Nation', 'Age']
-    gw_df = gw_df.drop(columns=cols)
-
-    # move matchid, playerid, and min to the front
-    cols = ['matchID', 'playerID', 'League', 'Club', 'Min']
-    cols = cols[::-1]
-    df_cols = gw_df.columns.tolist()
-    for col in cols:
-        df_cols.insert(0, df_cols.pop(df_cols.index(col)))
-    gw_df = gw_df[df_cols]
-
-    # convert to firestore columns
-    gw_df.columns = [col.lower() for col in gw_df.columns]
-    gw_df.rename(columns={'pos': 'position', 'player': 'name', 'mp': 'matches', 'min': 'mins'}, inplace=True)
+        # move matchid, playerid, and min to the front
+        cols = ['matchID', 'playerID', 'League', 'Club', 'Min']
+        cols = cols[::-1]
+        df_cols = gw_df.columns.tolist()
+        for col in cols:
+            df_cols.insert(0, df_cols.pop(df_cols.index(col)))
+        gw_df = gw_df[df_cols]
+
+        # convert to firestore columns
+        gw_df.columns = [col.lower() for col in gw_df.columns]
+        gw_df.rename(columns={'pos': 'position', 'player': 'name', 'mp': 'matches', 'min': 'mins'}, inplace=True)
+
+        # shrink to the declared compact dtypes
+        compact = apply_schema(gw_df)
+        if label:
+            memory_report(gw_df, compact, label)
+        unit.count(rows=len(compact))
+        return compact
+
+
+def iter_player_match_rows(league, gws, schedule=None, manifest=None):
+    """Yield (gw, matchID, frame) for each played match, one typed batch at a time
+
+    gws is a list of gameweeks, or {gw: [match ids]} to take only some
+    matches. Reports are fetched and parsed ahead of the consumer through a
+    bounded pipeline, so memory stays flat however many gameweeks are
+    requested.
+    """
+    schedule = schedule or get_schedule(URLS[league]['matches'])
+    units = gws if isinstance(gws, dict) else dict.fromkeys(gws)
+    matches = [(gw, url) for gw, match_ids in units.items() for url in schedule.match_urls(gw, match_ids)]
+
+    for (gw, url), report in zip(matches, iter_match_reports([url for _, url in matches])):
+        print(f'GW {gw}: Retrieved data for {report.teams[0]} vs. {report.teams[1]}')
+        if manifest is not None:
+            manifest.mark(league, gw, [report.match_id], 'fetched')
+            manifest.mark(league, gw, [report.match_id], 'parsed')
+        yield gw, report.match_id, player_match_frame([report], league, gw)
+
+def get_player_match_data(league, gw, export=False, schedule=None, match_ids=None, manifest=None):
+    # get link from each played match in the gameweek, or just the given ones
+    url = URLS[league]['matches']
+    schedule = schedule or get_schedule(url)
+    matches = schedule.match_urls(gw, match_ids)
+
+    # fetch and parse each report once, the parsing spread over a process pool
+    # while the rest download; each stats table comes back attributed to its club
+    reports = parse_match_reports(matches)
+    for report in reports:
+        print(f'GW {gw}: Retrieved data for {report.teams[0]} vs. {report.teams[1]}')
+    if manifest is not None:
+        manifest.mark(league, gw, [match_id(match) for match in matches], 'fetched')
+        manifest.mark(league, gw, [report.match_id for report in reports], 'parsed')
+
+    # join every table of every match in one pass
+    print('Done.\n--------------------------')
+    gw_df = player_match_frame(reports, league, gw, label=f'{league} GW {gw}')
 
     # export if specified
     if export:
-        league = url.split('/')[-1].replace('-Scores-and-Fixtures', '')
-        gw_df.to_csv(f'data/match_data/{league}_gw{gw}.csv', index=False)
+        import store
+        store.write(gw_df, 'player_match', league=league, season=schedule.season, gw=gw)
 
     return gw_df
 
@@ -285,21 +359,17 @@ def get_player_data(league, export=False):
     """Scrape permanent data for each player's profile"""
     # get url for each team
     url = URLS[league]['players']
-    df = get_dataframe(url)
-    team_urls = df['Squad'].map(lambda x: HOME_URL + x[1]).values
+    df = get_dataframe(url, links=['Squad'])
+    team_urls = (HOME_URL[:-1] + df['Squad_link']).tolist()
 
     # create empty dataframe to store player data
     player_df = pd.DataFrame()
 
     # get data for each team
-    for team in team_urls:
+    for team, data in zip(team_urls, fetch_many(team_urls)):
         team_name = ' '.join(team.split('/')[-1].split('-')[:-1])
         print(f'Retrieving data for {team_name}...')
-        df = pd.read_html(team, extract_links='all')[0]
-        df.columns = [x[-1][0] for x in df.columns]
-        df = df.T.groupby(level=0).first().T
-        df['Club'] = team_name
-        df['League'] = league
+        df = read_html(data)[0]
 
         # move player, nation, pos, age, mp, starts, and mins to first columns
         cols = ['playerID', 'player_url', 'Player', 'Pos', 'Club', 'League', 
@@ -308,8 +378,9 @@ def get_player_data(league, export=False):
 
         # clean columns
         df = clean_columns(df, pos=True)
+        df['Club'] = team_name
+        df['League'] = league
         df = df.drop(columns='Matches')
-        df = df.fillna(0)
 
         # move each col to front of df, remove unnecessary columns
         for col in cols:
@@ -317,35 +388,35 @@ def get_player_data(league, export=False):
             df_cols.insert(0, df_cols.pop(df_cols.index(col)))
         df = df[cols[::-1]]
 
-        # convert to numeric columns where possible
-        df = df.apply(pd.to_numeric, errors='ignore')
-
         # confirm data was retrieved
         print('Done.\n--------------------------')
 
         # add df to player_df
         player_df = pd.concat([player_df, df], ignore_index=True)
 
-        # sleep for 3 seconds to avoid getting blocked
-        time.sleep(3)
-
     # change all columns in dataframe to numeric where possible
-    player_df = player_df.apply(pd.to_numeric, errors='ignore')
+    player_df = to_numeric(player_df)
 
     # modify columns for firestore
     player_df.columns = [col.lower() for col in player_df.columns]
     player_df.rename(columns={'pos': 'position', 'player': 'name', 'mp': 'matches', 'min': 'mins', 'playerid': 'ID'}, inplace=True)
 
 
+    # shrink to the declared compact dtypes
+    compact = apply_schema(player_df)
+    memory_report(player_df, compact, f'{league} players')
+    player_df = compact
+
     if export:
-        league = url.split('/')[-1].replace('-Stats', '')
-        player_df.to_csv(f'data/player_data/{league}_player_data.csv', index=False)
+        import store
+        store.write(player_df, 'players', league=league, season=current_season())
 
     return player_df
 
 
 if __name__ == '__main__':
     for league in URLS.keys():
-        get_player_data(URLS[league]['players'], export=True, league=league)
+        get_player_data(league, export=True)
         for gw in range(1, 2):
-            get_player_match_data(URLS[league]['matches'], gw, export=True, league=league)
+            get_matches(URLS[league]['matches'], gw, export=True)
+            get_player_match_data(league, gw, export=True)
@@ -0,0 +1,212 @@
+"""Player search for the transactions page: accent-insensitive prefix and typo-tolerant name lookup
+
+    python search.py mbape [--league 'Ligue 1'] [--club ...] [--pos FW] [--limit 10]   (needs sql.config)
+
+The index is built in memory from player rows: the player table's
+playerID, Player, Pos, Club and League, or the same columns under the
+firestore-style names get_player_data returns (ID, name, position, club,
+league). Name words
+are kept sorted for prefix lookup and broken into trigrams for typos, so
+"mbape" finds Mbappé and "odegard" finds Ødegaard. update() reindexes only
+the players whose rows changed, e.g. after a transfer.
+"""
+import argparse
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, namedtuple
+
+import pandas as pd
+
+COLUMNS = ['playerID', 'Player', 'Pos', 'Club', 'League']
+# get_player_data's names for the same columns
+FIRESTORE_NAMES = {'ID': 'playerID', 'name': 'Player', 'position': 'Pos', 'club': 'Club', 'league': 'League'}
+Player = namedtuple('Player', ['id', 'name', 'pos', 'club', 'league'])
+
+# letters NFKD doesn't split into a base letter and an accent
+TRANSLITERATE = str.maketrans({'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'æ': 'ae', 'œ': 'oe', 'ß': 'ss',
+                               'ı': 'i', "'": None, '’': None})
+
+# words sharing at least this share of their trigrams count as typos of each other;
+# a typo scores below a prefix, which scores below the whole word
+MIN_SIMILARITY = 0.3
+PREFIX_SCORE = 0.9
+
+# query words shorter than this are only matched as prefixes
+MIN_FUZZY_LENGTH = 3
+
+
+def normalize(text):
+    """Casefolded text without accents or apostrophes, other punctuation as spaces"""
+    text = unicodedata.normalize('NFKD', str(text).casefold().translate(TRANSLITERATE))
+    return ''.join(' ' if not char.isalnum() else char for char in text if not unicodedata.combining(char))
+
+
+def words(text):
+    return normalize(text).split()
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Players by name words, trigrams of those words, league, club and position"""
+
+    def __init__(self):
+        self.players = {}
+        self.words = []
+        self.word_players = defaultdict(set)
+        self.word_grams = {}
+        self.grams = defaultdict(set)
+        self.filters = {'league': defaultdict(set), 'club': defaultdict(set), 'pos': defaultdict(set)}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, frame):
+        index = cls()
+        index.update(frame)
+        return index
+
+    @staticmethod
+    def keys(player):
+        # fbref lists players in several positions as "DF,MF"
+        return {'league': [' '.join(words(player.league))], 'club': [' '.join(words(player.club))],
+                'pos': [' '.join(words(pos)) for pos in player.pos.split(',')]}
+
+    def add(self, player):
+        self.players[player.id] = player
+        for word in set(words(player.name)):
+            if word not in self.word_players:
+                insort(self.words, word)
+                self.word_grams[word] = len(trigrams(word))
+                for gram in trigrams(word):
+                    self.grams[gram].add(word)
+            self.word_players[word].add(player.id)
+        for field, values in self.keys(player).items():
+            for value in values:
+                self.filters[field][value].add(player.id)
+
+    def discard(self, player_id):
+        player = self.players.pop(player_id)
+        for word in set(words(player.name)):
+            self.word_players[word].discard(player_id)
+            if not self.word_players[word]:
+                del self.word_players[word], self.word_grams[word]
+                del self.words[bisect_left(self.words, word)]
+                for gram in trigrams(word):
+                    self.grams[gram].discard(word)
+        for field, values in self.keys(player).items():
+            for value in values:
+                self.filters[field][value].discard(player_id)
+
+    def update(self, frame, prune=False):
+        """Index new players and reindex changed ones, returning how many changed
+
+        With prune=True frame is taken as every player there is, and players
+        missing from it are dropped.
+        """
+        frame = frame.rename(columns=FIRESTORE_NAMES)[COLUMNS]
+        rows = frame.astype(object).where(frame.notna(), '')
+        changed = 0
+        with self.lock:
+            seen = set()
+            for row in rows.itertuples(index=False, name=None):
+                player = Player(*map(str, row))
+                seen.add(player.id)
+                if self.players.get(player.id) == player:
+                    continue
+                if player.id in self.players:
+                    self.discard(player.id)
+                self.add(player)
+                changed += 1
+            if prune:
+                for player_id in set(self.players) - seen:
+                    self.discard(player_id)
+                    changed += 1
+        return changed
+
+    def remove(self, player_ids):
+        with self.lock:
+            for player_id in player_ids:
+                if player_id in self.players:
+                    self.discard(player_id)
+
+    def matches(self, word, fuzzy=True):
+        """{player id: score} for the players with a name word starting with word, or like it"""
+        scores = {}
+
+        def hit(name_word, score):
+            for player_id in self.word_players[name_word]:
+                if scores.get(player_id, 0) < score:
+                    scores[player_id] = score
+
+        i = bisect_left(self.words, word)
+        while i < len(self.words) and self.words[i].startswith(word):
+            hit(self.words[i], 1.0 if self.words[i] == word else PREFIX_SCORE)
+            i += 1
+
+        if fuzzy and len(word) >= MIN_FUZZY_LENGTH:
+            grams = trigrams(word)
+            shared = Counter(name_word for gram in grams for name_word in self.grams.get(gram, ()))
+            for name_word, n in shared.items():
+                similarity = n / (len(grams) + self.word_grams[name_word] - n)
+                if similarity >= MIN_SIMILARITY:
+                    hit(name_word, similarity * PREFIX_SCORE)
+        return scores
+
+    def search(self, query='', league=None, club=None, pos=None, limit=20, fuzzy=True):
+        """The players best matching query, as (Player, score) pairs
+
+        Every word of query has to match a word of the name, by prefix or as
+        a typo. Filters match case and accents aside; an empty query lists
+        everyone passing them by name.
+        """
+        with self.lock:
+            allowed = None
+            for field, value in [('league', league), ('club', club), ('pos', pos)]:
+                if value:
+                    ids = self.filters[field].get(' '.join(words(value)), set())
+                    allowed = ids if allowed is None else allowed & ids
+
+            query_words = words(query)
+            if not query_words:
+                players = (self.players[player_id] for player_id in (self.players if allowed is None else allowed))
+                return [(player, 0.0) for player in heapq.nsmallest(limit, players, key=lambda player: player.name)]
+
+            scores = None
+            for word in query_words:
+                word_scores = self.matches(word, fuzzy)
+                scores = word_scores if scores is None else {player_id: score + word_scores[player_id]
+                                                             for player_id, score in scores.items() if player_id in word_scores}
+            if allowed is not None:
+                scores = {player_id: score for player_id, score in scores.items() if player_id in allowed}
+            best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.players[item[0]].name))
+            return [(self.players[player_id], round(score / len(query_words), 3)) for player_id, score in best]
+
+
+def player_frame(conn):
+    """Every row of the player table, in the columns the index is built from"""
+    with conn.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM player')
+        return pd.DataFrame(cursor.fetchall(), columns=COLUMNS)
+
+
+if __name__ == '__main__':
+    from db import mysqlconnect
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('query', nargs='?', default='')
+    parser.add_argument('--league')
+    parser.add_argument('--club')
+    parser.add_argument('--pos')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = mysqlconnect()
+    index = SearchIndex.build(player_frame(conn))
+    conn.close()
+    for player, score in index.search(args.query, args.league, args.club, args.pos, args.limit):
+        print(f'{score:>5.2f}  {player.name:<30} {player.pos:<8} {player.club:<24} {player.league}')
@@ -0,0 +1,155 @@
+import sys
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from leagues import URLS
+from scraping import current_season, get_schedule
+
+
+class Sink:
+    """Somewhere scraped batches go
+
+    write() takes one match's player_match rows and write_players() one
+    league's player rows; both commit before returning, so whatever a sink
+    has acknowledged survives a crash later in the run. finish() is called
+    once a league's matches are all written, for anything derived from
+    them. Sinks are handed the same in-memory frames, so adding one costs
+    no extra scraping. name is the key the manifest records commits under.
+    """
+    name = None
+
+    def write(self, league, gw, match_id, frame):
+        raise NotImplementedError
+
+    def write_players(self, league, frame):
+        pass
+
+    def finish(self, league):
+        pass
+
+    def close(self):
+        pass
+
+
+class MySQLSink(Sink):
+    name = 'mysql'
+
+    def __init__(self, conn=None, batch_size=None, local_infile=False, pool=None):
+        import db
+        self.db = db
+        self.pool = pool
+        self.conn = None if pool else conn or db.mysqlconnect(local_infile=local_infile)
+        self.batch_size = batch_size or db.BATCH_SIZE
+        self.local_infile = local_infile
+
+        # one connection, so leagues loading side by side take turns with it; with a pool each
+        # write checks out its own, and since ingest writes a league's matches one after another
+        # they still commit in order
+        self.lock = threading.Lock()
+
+        # the tables have to exist before the first batch arrives
+        with self.connection() as conn:
+            db.migrate(conn)
+
+    @contextmanager
+    def connection(self):
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+        else:
+            with self.lock:
+                yield self.conn
+
+    def load(self, func, *args, **kwargs):
+        # leagues writing at once can deadlock on player_stats; the loser is rolled back and run again
+        def attempt():
+            with self.connection() as conn:
+                return func(conn, *args, **kwargs)
+        return self.db.retry_locks(attempt)
+
+    def write(self, league, gw, match_id, frame):
+        self.load(self.db.load_player_games, frame, gw, batch_size=self.batch_size, local_infile=self.local_infile)
+        print(f'Imported into player_game ({league}, GW {gw}, match {match_id})')
+
+    def write_players(self, league, frame):
+        self.load(self.db.load_players, frame, batch_size=self.batch_size, local_infile=self.local_infile)
+        print(f'Imported into player ({league})')
+
+    def finish(self, league):
+        # the data page's rolling windows and leaderboards, as of the gameweek just loaded
+        import aggregates
+        self.load(aggregates.refresh, league)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class FirestoreSink(Sink):
+    name = 'firestore'
+
+    def __init__(self, client=None):
+        # importing firestore connects to it, so only do that if this sink is used
+        if client is None:
+            import firestore as client
+        self.firestore = client
+
+    def write(self, league, gw, match_id, frame):
+        fixture = get_schedule(URLS[league]['matches']).fixture(match_id)
+        stats = self.firestore.write_match(league, gw, match_id, frame, fixture)
+        if stats['failed']:
+            raise RuntimeError(f'{stats["failed"]} firestore writes failed for match {match_id}')
+
+    def write_players(self, league, frame):
+        stats = self.firestore.write_players(league, frame)
+        if stats['failed']:
+            raise RuntimeError(f'{stats["failed"]} firestore writes failed for {league} players')
+
+
+class ParquetSink(Sink):
+    name = 'parquet'
+
+    def __init__(self, root=None):
+        import store
+        self.store = store
+        self.root = root or store.STORE_DIR
+
+    def write(self, league, gw, match_id, frame):
+        schedule = get_schedule(URLS[league]['matches'])
+        self.store.write(frame, 'player_match', root=self.root, part=match_id, league=league, season=schedule.season, gw=gw)
+
+        # the fixture goes beside its rows, so rescoring has the final score for clean sheets
+        fixture = pd.DataFrame([schedule.fixture(match_id)])
+        self.store.write(fixture, 'matches', root=self.root, part=match_id, league=league, season=schedule.season, gw=gw)
+
+    def write_players(self, league, frame):
+        self.store.write(frame, 'players', root=self.root, league=league, season=current_season())
+
+
+class StdoutSink(Sink):
+    """Prints a line per batch, or the rows themselves as csv, e.g. for dry runs or piping"""
+    name = 'stdout'
+
+    def __init__(self, rows=False, stream=None):
+        self.rows = rows
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def write(self, league, gw, match_id, frame):
+        self.emit(f'{league} GW {gw} match {match_id}: {len(frame)} player rows', frame)
+
+    def write_players(self, league, frame):
+        self.emit(f'{league}: {len(frame)} players', frame)
+
+    def emit(self, line, frame):
+        with self.lock:
+            if self.rows:
+                frame.to_csv(self.stream, index=False)
+            else:
+                print(line, file=self.stream)
+            self.stream.flush()
+
+
+SINKS = {'mysql': MySQLSink, 'firestore': FirestoreSink, 'parquet': ParquetSink, 'stdout': StdoutSink}
@@ -0,0 +1,151 @@
+import glob
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from schema import widen
+
+STORE_DIR = 'data/store'
+
+# file formats a partition can be written in. zstd parquet is smallest on disk but every read
+# decompresses and decodes it; uncompressed arrow ipc is read straight out of the mapped file
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+FORMAT = os.environ.get('FBREF_STORE_FORMAT', 'parquet')
+
+# each dataset's hive partition keys, outermost first
+PARTITIONS = {
+    'matches': ['league', 'season', 'gw'],
+    'player_match': ['league', 'season', 'gw'],
+    'players': ['league', 'season'],
+    'points': ['league', 'season', 'gw'],
+}
+PARTITION_TYPES = {'league': pa.string(), 'season': pa.string(), 'gw': pa.int16()}
+TEXT_COLS = {'id', 'playerid', 'matchid', 'name', 'position', 'match_position', 'club', 'nation', 'player_url', 'home', 'away'}
+
+
+def arrow_schema(df):
+    """Stable arrow types for a frame: text columns as strings, everything else float64
+
+    A gameweek where a column happens to have no missing values would
+    otherwise come out int64 and clash with the gameweeks where it does.
+    """
+    return pa.schema([(col, pa.string() if col.lower() in TEXT_COLS or df[col].dtype in (object, 'category') else pa.float64())
+                      for col in df.columns])
+
+
+def partition_dir(dataset, root=STORE_DIR, **keys):
+    return os.path.join(root, dataset, *(f'{key}={keys[key]}' for key in PARTITIONS[dataset]))
+
+
+def write(df, dataset, root=STORE_DIR, part=None, format=None, **keys):
+    """Write a frame into one partition of a dataset
+
+    e.g. write(gw_df, 'player_match', league='Premier League', season='2023-2024', gw=1).
+    Partition keys are stored in the path, not in the file. Without a part
+    the frame replaces the whole partition; with one (e.g. a match id) it
+    replaces just that part, so a partition can be filled a batch at a time.
+    format is one of FORMATS, FORMAT (set by FBREF_STORE_FORMAT) by default.
+    """
+    missing = [key for key in PARTITIONS[dataset] if key not in keys]
+    if missing:
+        raise ValueError(f'{dataset} is partitioned by {PARTITIONS[dataset]}, missing {missing}')
+
+    df = widen(df.drop(columns=[col for col in df.columns if col in PARTITIONS[dataset]]))
+    schema = arrow_schema(df)
+
+    # text columns go in as strings whatever pandas inferred for them
+    text = [field.name for field in schema if field.type == pa.string()]
+    df = df.assign(**{col: df[col].astype(str).where(df[col].notna(), None) for col in text})
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    # write beside the old file and swap it in, so readers never see half a partition;
+    # dataset readers skip dot files
+    format = format or FORMAT
+    path = partition_dir(dataset, root, **keys)
+    stem = f'part-{part if part is not None else 0}'
+    name = stem + FORMATS[format]
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, f'.{name}.tmp')
+    if format == 'arrow':
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, os.path.join(path, name))
+
+    # the part written in another format, or with no part every other part, is replaced too
+    for file in os.listdir(path):
+        if file.startswith('part-') and file != name and (part is None or os.path.splitext(file)[0] == stem):
+            os.remove(os.path.join(path, file))
+    return os.path.join(path, name)
+
+
+def gameweeks(dataset, league, season, root=STORE_DIR):
+    """{gw: when its newest part was written} for one league season of a gameweek-partitioned dataset"""
+    base = os.path.join(root, dataset, f'league={league}', f'season={season}')
+    if not os.path.isdir(base):
+        return {}
+    written = {}
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        parts = [os.path.getmtime(os.path.join(path, file)) for file in os.listdir(path) if file.startswith('part-')]
+        if name.startswith('gw=') and parts:
+            written[int(name[3:])] = max(parts)
+    return written
+
+
+def dataset(name, root=STORE_DIR, memory_map=True):
+    """Open a dataset with its partition keys typed, reading files through mmap by default
+
+    Partitions can be in either format; each format's files are opened as
+    their own dataset and unioned.
+    """
+    base = os.path.join(root, name)
+    partitioning = ds.partitioning(
+        pa.schema([(key, PARTITION_TYPES[key]) for key in PARTITIONS[name]]), flavor='hive')
+    filesystem = fs.LocalFileSystem(use_mmap=memory_map)
+    parts = []
+    for format, ext in FORMATS.items():
+        files = sorted(glob.glob(os.path.join(base, '**', f'part-*{ext}'), recursive=True))
+        if files:
+            parts.append(ds.dataset(files, format='ipc' if format == 'arrow' else format, partitioning=partitioning,
+                                    partition_base_dir=base, filesystem=filesystem))
+    if not parts:
+        raise FileNotFoundError(f'no {name} files under {base}')
+    return parts[0] if len(parts) == 1 else ds.dataset(parts)
+
+
+def read(name, columns=None, league=None, season=None, gws=None, root=STORE_DIR, memory_map=True, to_pandas=True):
+    """Read a dataset, only opening the partitions and columns asked for
+
+    league, season and gws prune partitions before any file is read, and
+    columns limits which columns are read. Returns a DataFrame, or the
+    arrow Table with to_pandas=False.
+
+    Only arrow files are read without copying: mapped, their Table's
+    columns are slices of the files. Parquet pages are decompressed and
+    decoded into memory however they're read.
+    """
+    data = dataset(name, root, memory_map)
+    filters = []
+    if league is not None:
+        filters.append(ds.field('league').isin([league] if isinstance(league, str) else list(league)))
+    if season is not None:
+        filters.append(ds.field('season') == season)
+    if gws is not None:
+        filters.append(ds.field('gw').isin([gws] if isinstance(gws, int) else list(gws)))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    # batches as large as the files' own, so a file comes back as one chunk rather than sliced up
+    table = data.to_table(columns=columns, filter=expression, batch_size=1 << 30)
+    if not to_pandas:
+        return table
+
+    # split_blocks keeps each column in its own block, so a numeric column without nulls that comes
+    # from a single arrow file is handed to pandas without a copy; the rest are copied or converted
+    return table.to_pandas(split_blocks=True)